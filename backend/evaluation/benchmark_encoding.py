@@ -0,0 +1,108 @@
+# backend/evaluation/benchmark_encoding.py
+"""
+Payload size and serialization time of the response formats in services/response_encoding.py,
+compared with what /analyze/ocr returned before (jsonify, uncompressed).
+
+Run from the backend directory:
+    python -m evaluation.benchmark_encoding                       # synthetic dense diagram, 5000 words
+    python -m evaluation.benchmark_encoding --words 20000
+    python -m evaluation.benchmark_encoding --input ocr.json      # a saved /analyze/ocr response
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+
+from flask import Flask, jsonify
+
+from services import response_encoding
+from services.response_encoding import serialize, compress, columnar_ocr_blocks, expand_columnar_ocr_blocks
+
+# Label-like tokens seen on the sample diagrams, so compression ratios are realistic.
+SAMPLE_TOKENS = ("BB6648", "RI-A", "RI-B", "TN/IDL-B", "POWER-A", "AIR6449", "B41", "N78", "RRU", "CPRI",
+                 "ALARM", "TDD", "BITS", "CONSOLE", "10", "25", "Site", "Cabinet", "Radio", "Baseband")
+
+
+def synthetic_ocr_blocks(word_count, words_per_block=6, seed=0):
+    """extract_text_blocks()-shaped output for a dense diagram of `word_count` words."""
+    rng = random.Random(seed)
+    blocks = []
+    for block_num in range(1, word_count // words_per_block + 1):
+        left, top = rng.randrange(0, 12000), rng.randrange(0, 9000)
+        words = []
+        for i in range(words_per_block):
+            text = rng.choice(SAMPLE_TOKENS)
+            words.append({"text": text, "left": left + i * 70, "top": top + rng.randrange(-2, 3),
+                          "width": 12 * len(text) + rng.randrange(0, 6), "height": 18 + rng.randrange(0, 4),
+                          "conf": rng.randrange(50, 97)})
+        blocks.append({"block_num": block_num, "text": " ".join(w["text"] for w in words), "words": words})
+    return blocks
+
+
+def time_ms(fn, repeat):
+    """Median wall time of fn() over `repeat` runs, in milliseconds, and the last result."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 2), result
+
+
+def benchmark(blocks, repeat=5):
+    app = Flask(__name__)
+    rows = []
+    with app.app_context():
+        baseline_ms, baseline = time_ms(lambda: jsonify(blocks).get_data(), repeat)
+        rows.append({"format": "jsonify (current)", "encoding": "identity", "bytes": len(baseline),
+                     "serialize_ms": baseline_ms, "compress_ms": 0.0})
+
+        formats = ["json", "columnar"] + (["msgpack"] if response_encoding.msgpack is not None else [])
+        encodings = ["identity", "gzip"] + (["br"] if response_encoding.brotli is not None else [])
+        for response_format in formats:
+            serialize_ms, (body, _) = time_ms(lambda: serialize(blocks, response_format, columnar_ocr_blocks), repeat)
+            if response_format == "json":
+                assert body == baseline, "plain JSON must stay byte-identical to jsonify()"
+            if response_format == "columnar":
+                assert expand_columnar_ocr_blocks(json.loads(body)) == blocks, "columnar encoding must round-trip"
+            for encoding in encodings:
+                compress_ms, compressed = time_ms(lambda: compress(body, encoding), repeat) if encoding != "identity" else (0.0, body)
+                rows.append({"format": response_format, "encoding": encoding, "bytes": len(compressed),
+                             "serialize_ms": serialize_ms, "compress_ms": compress_ms})
+
+    for row in rows:
+        row["vs_current"] = round(row["bytes"] / rows[0]["bytes"], 3)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark response formats and compression for OCR results.")
+    parser.add_argument("--input", help="JSON file with an /analyze/ocr response (default: synthetic)")
+    parser.add_argument("--words", type=int, default=5000, help="Word count of the synthetic diagram")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (median is reported)")
+    parser.add_argument("--json", action="store_true", help="Print the rows as JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input, "r", encoding="utf-8") as f:
+            blocks = json.load(f)
+    else:
+        blocks = synthetic_ocr_blocks(args.words)
+
+    rows = benchmark(blocks, repeat=args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+
+    print(f"{sum(len(b['words']) for b in blocks)} words in {len(blocks)} blocks, median of {args.repeat} runs")
+    print(f"{'format':<18} {'encoding':<9} {'bytes':>10} {'vs current':>10} {'serialize ms':>13} {'compress ms':>12}")
+    for row in rows:
+        print(f"{row['format']:<18} {row['encoding']:<9} {row['bytes']:>10} {row['vs_current']:>10} "
+              f"{row['serialize_ms']:>13} {row['compress_ms']:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
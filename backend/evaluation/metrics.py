@@ -0,0 +1,88 @@
+# backend/evaluation/metrics.py
+import re
+from collections import Counter
+
+from services.analysis_store import parse_endpoint
+
+
+def precision_recall(predicted, expected):
+    """
+    Multiset precision/recall/F1 between two iterables of hashable keys.
+
+    Duplicates count: predicting the same edge twice when it exists once is one TP and one FP.
+    """
+    predicted, expected = Counter(predicted), Counter(expected)
+    tp = sum((predicted & expected).values())
+    return scores_from_counts(tp, sum(predicted.values()) - tp, sum(expected.values()) - tp)
+
+
+def scores_from_counts(tp, fp, fn):
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4), "tp": tp, "fp": fp, "fn": fn}
+
+
+def equipment_key(text):
+    """
+    Canonical key for a piece of equipment so "Baseband BB6648", "BB 6648" and "Baseband 6648" match.
+
+    Model numbers are unique within a site diagram, so the four digits are the key; equipment
+    without a model number (e.g. "GPS Antenna") falls back to its lower-cased words.
+    """
+    equipment, _, _ = parse_endpoint(text)
+    if equipment:
+        return re.sub(r"\D", "", equipment)
+    match = re.search(r"\b\d{4}\b", text or "")
+    if match:
+        return match.group(0)
+    return " ".join(re.findall(r"[a-z]+", (text or "").lower()))
+
+
+def _endpoint(text, port, with_port):
+    key = equipment_key(text)
+    if not with_port:
+        return key
+    _, _, parsed_port = parse_endpoint(text, port)
+    return f"{key}:{parsed_port or ''}"
+
+
+def edge_keys(edges, with_port=False):
+    """Direction-insensitive keys for edges given as {"source", "target"[, "source_port", "target_port"]}."""
+    keys = []
+    for edge in edges:
+        if not isinstance(edge, dict):
+            continue
+        a = _endpoint(str(edge.get("source", "")), edge.get("source_port"), with_port)
+        b = _endpoint(str(edge.get("target", "")), edge.get("target_port"), with_port)
+        keys.append(tuple(sorted((a, b))))
+    return keys
+
+
+def edge_metrics(predicted_edges, expected_edges):
+    """Scores edges at equipment level and, separately, with port ids required to match."""
+    return {
+        "equipment": precision_recall(edge_keys(predicted_edges), edge_keys(expected_edges)),
+        "ports": precision_recall(edge_keys(predicted_edges, True), edge_keys(expected_edges, True)),
+    }
+
+
+def node_metrics(predicted_labels, expected_labels):
+    # Each piece of equipment is counted once, however many boxes/labels the engine produced for it.
+    return precision_recall(set(map(equipment_key, predicted_labels)), set(map(equipment_key, expected_labels)))
+
+
+def ocr_word_metrics(ocr_blocks, expected_words):
+    """Word-level multiset precision/recall of OCR output against the annotated words (case-insensitive)."""
+    predicted = [w["text"].lower() for block in ocr_blocks for w in block.get("words", [])]
+    return precision_recall(predicted, [w.lower() for w in expected_words])
+
+
+def ocr_label_metrics(ocr_blocks, expected_words, labels):
+    """
+    ocr_word_metrics restricted to port labels: only words (predicted or annotated) that are
+    one of `labels` (e.g. "RI-A", "TN/IDL-B") count, so label accuracy isn't drowned out by prose.
+    """
+    labels = {label.lower() for label in labels}
+    predicted = [w["text"].lower() for block in ocr_blocks for w in block.get("words", [])]
+    return precision_recall([w for w in predicted if w in labels], [w.lower() for w in expected_words if w.lower() in labels])
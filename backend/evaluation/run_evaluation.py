@@ -0,0 +1,301 @@
+# backend/evaluation/run_evaluation.py
+"""
+Offline accuracy-and-latency evaluation over the annotated sample diagrams.
+
+Run from the backend directory:
+    python -m evaluation.run_evaluation                      # all engines, LLM replayed from recordings
+    python -m evaluation.run_evaluation --llm record         # call OpenAI once and save the responses
+    python -m evaluation.run_evaluation --engines ocr --baseline evaluation/reports/main.json
+    python -m evaluation.run_evaluation --engines ocr,ocr-two-pass   # single vs two-pass OCR, incl. port labels
+
+The report is written as sorted, indented JSON so two runs can be compared with a plain diff;
+--baseline additionally embeds the metric/timing deltas against an earlier report.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import datetime
+import resource
+import tracemalloc
+import traceback
+import subprocess
+from collections import Counter
+
+from PIL import Image
+
+from evaluation.metrics import scores_from_counts, edge_metrics, node_metrics, ocr_word_metrics, ocr_label_metrics
+from services.cassette import Cassette, CassetteChat, CassetteMiss
+from services.analysis_store import extract_items
+
+EVALUATION_DIR = os.path.dirname(os.path.abspath(__file__))
+ANNOTATIONS_DIR = os.path.join(EVALUATION_DIR, "annotations")
+CASSETTE_DIR = os.path.join(EVALUATION_DIR, "cassettes")
+DEFAULT_REPORT_PATH = os.path.join(EVALUATION_DIR, "reports", "latest.json")
+ENGINES = ("ocr", "ocr-two-pass", "yolo", "llm-nodes", "llm-edges")
+# --llm choice -> cassette mode for the LLM stages.
+LLM_MODES = {"replay": "replay", "record": "record", "live": "off"}
+# Stages reported for timing only, with the reason their accuracy isn't scored.
+TIMING_ONLY = {
+    "yolo": "yolov8n.pt detects COCO classes, which have no mapping to equipment labels yet",
+}
+
+
+def load_annotations(annotations_dir=ANNOTATIONS_DIR):
+    """Yields (name, annotation) for each ground-truth file, with "image" resolved to an absolute path."""
+    for filename in sorted(os.listdir(annotations_dir)):
+        if not filename.endswith(".json"):
+            continue
+        with open(os.path.join(annotations_dir, filename), "r", encoding="utf-8") as f:
+            annotation = json.load(f)
+        annotation["image"] = os.path.normpath(os.path.join(annotations_dir, annotation["image"]))
+        yield os.path.splitext(filename)[0], annotation
+
+
+def image_data_url(path):
+    """LLM stages get the image inline so recording/replay doesn't depend on GCS URLs staying valid."""
+    mime = "image/png" if path.lower().endswith(".png") else "image/jpeg"
+    with open(path, "rb") as f:
+        return f"data:{mime};base64," + base64.b64encode(f.read()).decode("ascii")
+
+
+def measure(fn, *args):
+    """
+    Runs fn(*args) and returns (result, stats).
+
+    cpu_ms includes finished child processes (Tesseract runs as a subprocess). peak_python_kb is
+    the tracemalloc peak for this call only; max_rss_kb is the process high-water mark so far and
+    therefore only ever grows across stages.
+    """
+    tracemalloc.start()
+    cpu_before = os.times()
+    wall_before = time.perf_counter()
+    try:
+        result = fn(*args)
+    finally:
+        wall_ms = (time.perf_counter() - wall_before) * 1000
+        cpu_after = os.times()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    cpu_ms = sum(after - before for after, before in zip(cpu_after[:4], cpu_before[:4])) * 1000
+    return result, {
+        "wall_ms": round(wall_ms, 1),
+        "cpu_ms": round(cpu_ms, 1),
+        "peak_python_kb": peak // 1024,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+# --- Stages: each returns (metrics, prediction summary); metrics is None for TIMING_ONLY stages ---
+
+def _ocr_metrics(blocks, annotation, port_ids):
+    return {
+        "words": ocr_word_metrics(blocks, annotation["ocr_words"]),
+        "port_labels": ocr_label_metrics(blocks, annotation["ocr_words"], [p for p in port_ids if not p.isdigit()]),
+    }
+
+
+def run_ocr(annotation, port_ids):
+    from services.ocr_engine import extract_text_blocks
+    image = Image.open(annotation["image"]).convert("RGB")
+    blocks = extract_text_blocks(image, cache=False) # Uncached, so repeated runs time real OCR work
+    return _ocr_metrics(blocks, annotation, port_ids), {"blocks": len(blocks)}
+
+
+def run_ocr_two_pass(annotation, port_ids):
+    from services.ocr_engine import extract_text_blocks_two_pass
+    image = Image.open(annotation["image"]).convert("RGB")
+    blocks = extract_text_blocks_two_pass(image, list(port_ids), cache=False)
+    reread = sum(1 for block in blocks for w in block["words"] if w.get("reocr"))
+    return _ocr_metrics(blocks, annotation, port_ids), {"blocks": len(blocks), "recovered_words": reread}
+
+
+def run_yolo(annotation):
+    from services.node_detector_yolo import detect_equipment_nodes
+    image = Image.open(annotation["image"]).convert("RGB")
+    detections = detect_equipment_nodes(image)
+    return None, {"detections": len(detections)}
+
+
+def run_llm_nodes(annotation):
+    from services.node_detector_llm import detect_nodes_llm
+    nodes = extract_items(detect_nodes_llm(image_data_url(annotation["image"])), "nodes")
+    labels = [str(n.get("label", "")) if isinstance(n, dict) else str(n) for n in nodes]
+    return node_metrics(labels, [n["label"] for n in annotation["nodes"]]), {"nodes": len(nodes)}
+
+
+def load_reference_port_ids():
+    """The same port-id whitelist /analyze/ocr uses in two-pass mode."""
+    import services_api
+    return services_api.get_reference_port_ids(services_api.reference_library.snapshot())
+
+
+def load_fewshot_reference():
+    """The same reference material and truncation the /analyze/edges-fewshot route sends."""
+    import services_api
+    return services_api.get_truncated_reference(services_api.reference_library.snapshot())
+
+
+def run_llm_edges(annotation, reference):
+    from services.edge_detector_fewshot_llm import detect_edges_fewshot
+    result = detect_edges_fewshot(image_data_url(annotation["image"]), reference)
+    if isinstance(result, dict) and "error" in result:
+        raise RuntimeError(result["error"])
+    edges = extract_items(result, "edges")
+    return edge_metrics(edges, annotation["edges"]), {"edges": len(edges)}
+
+
+STAGE_RUNNERS = {"ocr": run_ocr, "ocr-two-pass": run_ocr_two_pass, "yolo": run_yolo,
+                 "llm-nodes": run_llm_nodes, "llm-edges": run_llm_edges}
+
+
+def evaluate(engines, llm_mode="replay", cassette_dir=CASSETTE_DIR, annotations_dir=ANNOTATIONS_DIR, latency_scale=1.0):
+    import openai
+    runners = {engine: STAGE_RUNNERS[engine] for engine in engines}
+    if "ocr" in runners or "ocr-two-pass" in runners:
+        port_ids = load_reference_port_ids()
+        for engine in ("ocr", "ocr-two-pass"):
+            if engine in runners:
+                runners[engine] = lambda annotation, run=STAGE_RUNNERS[engine]: run(annotation, port_ids)
+    if "llm-edges" in runners:
+        # Loaded before the key check below: importing services_api (re)reads OPENAI_API_KEY.
+        reference = load_fewshot_reference()
+        runners["llm-edges"] = lambda annotation: run_llm_edges(annotation, reference)
+    if llm_mode == "replay" and not openai.api_key:
+        openai.api_key = "replay"  # Services refuse to run without a key; replay never sends it.
+
+    # Replayed LLM stages sleep for the recorded latency (times latency_scale), so wall_ms stays comparable to live runs.
+    llm = CassetteChat(Cassette(cassette_dir, "llm", mode=LLM_MODES[llm_mode], latency_scale=latency_scale), openai.chat)
+    original_chat, openai.chat = openai.chat, llm
+    diagrams = {}
+    try:
+        for name, annotation in load_annotations(annotations_dir):
+            stages = {}
+            for engine, runner in runners.items():
+                print(f"[{name}] running {engine}...")
+                try:
+                    (metrics, predicted), stats = measure(runner, annotation)
+                    stages[engine] = dict(stats, predicted=predicted)
+                    if engine in TIMING_ONLY:
+                        stages[engine]["timing_only"] = TIMING_ONLY[engine]
+                    else:
+                        stages[engine]["metrics"] = metrics
+                except ImportError as e:
+                    stages[engine] = {"skipped": f"engine not installed: {e}"}
+                except CassetteMiss as e:
+                    stages[engine] = {"skipped": str(e).strip("'\"")}
+                except Exception as e:
+                    traceback.print_exc()
+                    stages[engine] = {"error": str(e)}
+                tokens = llm.take_usage()
+                if tokens:
+                    stages[engine]["tokens"] = tokens
+            diagrams[name] = {"image": os.path.relpath(annotation["image"], os.path.dirname(EVALUATION_DIR)), "stages": stages}
+    finally:
+        openai.chat = original_chat
+
+    return {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "llm_mode": llm_mode,
+        "engines": list(engines),
+        "diagrams": diagrams,
+        "summary": summarize(diagrams),
+    }
+
+
+def _iter_scores(metrics, prefix=""):
+    """Flattens {"precision":..} or {"equipment": {...}, "ports": {...}} into (name, scores) pairs."""
+    if "tp" in metrics:
+        yield prefix or "overall", metrics
+        return
+    for key, value in metrics.items():
+        yield from _iter_scores(value, f"{prefix}.{key}" if prefix else key)
+
+
+def summarize(diagrams):
+    """Per-stage totals and micro-averaged precision/recall (TP/FP/FN summed over diagrams)."""
+    summary = {}
+    for diagram in diagrams.values():
+        for engine, stage in diagram["stages"].items():
+            if "wall_ms" not in stage:
+                continue  # Skipped or failed
+            entry = summary.setdefault(engine, {"diagrams": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "peak_python_kb": 0, "tokens": Counter(), "counts": {}})
+            entry["diagrams"] += 1
+            entry["wall_ms"] = round(entry["wall_ms"] + stage["wall_ms"], 1)
+            entry["cpu_ms"] = round(entry["cpu_ms"] + stage["cpu_ms"], 1)
+            entry["peak_python_kb"] = max(entry["peak_python_kb"], stage["peak_python_kb"])
+            entry["tokens"].update(stage.get("tokens", {}))
+            for name, scores in _iter_scores(stage.get("metrics", {})):
+                counts = entry["counts"].setdefault(name, Counter())
+                counts.update({k: scores[k] for k in ("tp", "fp", "fn")})
+
+    for entry in summary.values():
+        entry["tokens"] = dict(entry["tokens"])
+        entry["metrics"] = {
+            name: scores_from_counts(c["tp"], c["fp"], c["fn"])
+            for name, c in entry.pop("counts").items()
+        }
+    return summary
+
+
+def compare_reports(baseline, current):
+    """Deltas (current - baseline) of summary timings, tokens and precision/recall/F1 per stage."""
+    deltas = {}
+    for engine, entry in current["summary"].items():
+        base = baseline.get("summary", {}).get(engine)
+        if not base:
+            continue
+        delta = {k: round(entry[k] - base[k], 1) for k in ("wall_ms", "cpu_ms") if k in base}
+        for token_key, value in entry["tokens"].items():
+            delta[token_key] = value - base.get("tokens", {}).get(token_key, 0)
+        for name, scores in entry["metrics"].items():
+            if name in base.get("metrics", {}):
+                delta[name] = {k: round(scores[k] - base["metrics"][name][k], 4) for k in ("precision", "recall", "f1")}
+        deltas[engine] = delta
+    return deltas
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=EVALUATION_DIR, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate analysis engines against annotated sample diagrams.")
+    parser.add_argument("--engines", default=",".join(ENGINES), help=f"Comma-separated subset of {ENGINES}")
+    parser.add_argument("--llm", default="replay", choices=list(LLM_MODES), help="How LLM stages reach the model")
+    parser.add_argument("--cassettes", default=CASSETTE_DIR, help="Cassette directory for recorded LLM responses")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Replay delay as a multiple of the recorded latency")
+    parser.add_argument("--annotations", default=ANNOTATIONS_DIR, help="Directory of ground-truth annotation files")
+    parser.add_argument("--output", default=DEFAULT_REPORT_PATH, help="Where to write the JSON report")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    args = parser.parse_args(argv)
+
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    unknown = [e for e in engines if e not in ENGINES]
+    if unknown:
+        parser.error(f"Unknown engines: {unknown}. Choose from {ENGINES}")
+
+    report = evaluate(engines, llm_mode=args.llm, cassette_dir=args.cassettes, annotations_dir=args.annotations,
+                      latency_scale=args.latency_scale)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["comparison"] = {"baseline": args.baseline, "deltas": compare_reports(json.load(f), report)}
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(json.dumps(report["summary"], indent=2, sort_keys=True))
+    print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
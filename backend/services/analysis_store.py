@@ -0,0 +1,425 @@
+# backend/services/analysis_store.py
+import os
+import re
+import json
+import sqlite3
+import datetime
+import threading
+
+# --- Store Configuration ---
+ANALYSIS_STORE_PATH = os.getenv(
+    "ANALYSIS_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "analysis_store.sqlite3")
+)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# ---------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS diagrams (
+    id INTEGER PRIMARY KEY,
+    diagram_key TEXT NOT NULL UNIQUE,
+    site TEXT,
+    latest_revision_id INTEGER,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_diagrams_site ON diagrams(site);
+
+CREATE TABLE IF NOT EXISTS revisions (
+    id INTEGER PRIMARY KEY,
+    diagram_id INTEGER NOT NULL REFERENCES diagrams(id),
+    revision INTEGER NOT NULL,
+    image_url TEXT,
+    metadata TEXT,
+    created_at TEXT NOT NULL,
+    UNIQUE (diagram_id, revision)
+);
+
+CREATE TABLE IF NOT EXISTS ocr_blocks (
+    id INTEGER PRIMARY KEY,
+    revision_id INTEGER NOT NULL REFERENCES revisions(id),
+    page INTEGER NOT NULL DEFAULT 1,
+    block_num INTEGER,
+    text TEXT NOT NULL,
+    words TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ocr_blocks_revision ON ocr_blocks(revision_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS ocr_blocks_fts USING fts5(
+    text, content='ocr_blocks', content_rowid='id', tokenize="unicode61 tokenchars '-/'"
+);
+
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    revision_id INTEGER NOT NULL REFERENCES revisions(id),
+    source_tool TEXT NOT NULL,
+    label TEXT NOT NULL,
+    equipment TEXT,
+    equipment_type TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_nodes_revision ON nodes(revision_id);
+CREATE INDEX IF NOT EXISTS idx_nodes_equipment ON nodes(equipment, equipment_type);
+
+CREATE TABLE IF NOT EXISTS edges (
+    id INTEGER PRIMARY KEY,
+    revision_id INTEGER NOT NULL REFERENCES revisions(id),
+    source_tool TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_edges_revision ON edges(revision_id);
+
+-- One row per edge end, so "X port P connects to a Y" is a single indexed self-join.
+CREATE TABLE IF NOT EXISTS port_refs (
+    id INTEGER PRIMARY KEY,
+    edge_id INTEGER NOT NULL REFERENCES edges(id),
+    revision_id INTEGER NOT NULL REFERENCES revisions(id),
+    side TEXT NOT NULL CHECK (side IN ('source', 'target')),
+    equipment TEXT,
+    equipment_type TEXT,
+    port TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_port_refs_lookup ON port_refs(equipment, port, revision_id);
+CREATE INDEX IF NOT EXISTS idx_port_refs_edge ON port_refs(edge_id, side);
+"""
+
+# Equipment families as they appear in diagrams, LLM output and site_reference.md
+# ("Baseband 6648", "BB6648", "Router 6671", "Air 3278", "RU6694").
+EQUIPMENT_PATTERNS = [
+    ("baseband", "BB", re.compile(r"\b(?:baseband|bb)\s*-?\s*(\d{4})\b", re.IGNORECASE)),
+    ("router", "R", re.compile(r"\b(?:router|r)\s*-?\s*(\d{4})\b", re.IGNORECASE)),
+    ("radio", "AIR", re.compile(r"\bair\s*-?\s*(\d{4})\b", re.IGNORECASE)),
+    ("radio", "RU", re.compile(r"\b(?:radio(?:\s+unit)?|ru)\s*-?\s*(\d{4})\b", re.IGNORECASE)),
+]
+EQUIPMENT_TYPE_WORDS = [
+    ("baseband", re.compile(r"\b(?:baseband|bb)\b", re.IGNORECASE)),
+    ("router", re.compile(r"\brouter\b", re.IGNORECASE)),
+    ("radio", re.compile(r"\b(?:radio|ru|rru|air)\b", re.IGNORECASE)),
+    ("antenna", re.compile(r"\bantenna\b", re.IGNORECASE)),
+]
+# Port ids as used in the reference port tables: RI-A, TN/IDL-B, POWER-A, TN-C, ...
+PORT_PATTERN = re.compile(r"\b([A-Z]{2,}(?:/[A-Z]{2,})?-[A-Z0-9]{1,2})\b")
+# Router ports are numbered: "Router 6671 port 10", "R6671 10".
+NUMBERED_PORT_PATTERN = re.compile(r"\bport\s*[:#]?\s*(\d{1,3})\b", re.IGNORECASE)
+TRAILING_PORT_PATTERN = re.compile(r"\b(\d{1,2})\s*$")
+PORT_KEYWORDS = ("SYNC", "GPS", "LMT", "EC", "SAU", "USB", "BITS", "TDD", "CONSOLE", "ALARM")
+
+
+def parse_endpoint(text, port=None):
+    """
+    Splits an edge end such as "Baseband BB6648 RI-A" into (equipment, equipment_type, port).
+
+    equipment is a canonical model code ("BB6648", "R6671", "AIR3278") when one is
+    recognisable; an explicitly supplied port wins over one parsed from the text.
+    """
+    text = text or ""
+    equipment, equipment_type = None, None
+    for family_type, prefix, pattern in EQUIPMENT_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            equipment, equipment_type = f"{prefix}{match.group(1)}", family_type
+            break
+    if equipment_type is None:
+        for family_type, pattern in EQUIPMENT_TYPE_WORDS:
+            if pattern.search(text):
+                equipment_type = family_type
+                break
+
+    if port in (None, "", "n/a"):
+        port = None
+        match = PORT_PATTERN.search(text.upper()) or NUMBERED_PORT_PATTERN.search(text)
+        if match:
+            port = match.group(1)
+        else:
+            for keyword in PORT_KEYWORDS:
+                if re.search(rf"\b{keyword}\b", text, re.IGNORECASE):
+                    port = keyword
+                    break
+            else:
+                # A bare one- or two-digit number after the model code ("Router 6671 10").
+                match = TRAILING_PORT_PATTERN.search(text)
+                if match:
+                    port = match.group(1)
+    return equipment, equipment_type, (str(port).upper() if port is not None else None)
+
+
+def extract_items(result, key):
+    """Tool results arrive either as a bare list or wrapped in an object (e.g. {"edges": [...]})."""
+    if result is None:
+        return []
+    if isinstance(result, list):
+        return result
+    if isinstance(result, dict):
+        if isinstance(result.get(key), list):
+            return result[key]
+        for value in result.values():
+            if isinstance(value, list):
+                return value
+    return []
+
+
+def _fts_query(query):
+    """
+    Quotes bare terms so port labels like RI-A or TN/IDL-B are searched literally
+    (FTS5 would otherwise parse '-' and '/' as syntax). Queries containing quotes are passed through.
+    """
+    if '"' in query:
+        return query
+    terms = []
+    for term in query.split():
+        if term in ("AND", "OR", "NOT"):
+            terms.append(term)
+        elif term.endswith("*"):
+            terms.append(f'"{term.rstrip("*")}"*')  # Prefix query: RI-A* -> "RI-A"*
+        else:
+            terms.append(f'"{term}"')
+    return " ".join(terms)
+
+
+def _canonical_equipment(value):
+    """Canonical model code for a query filter ("Baseband 6648", "bb 6648" -> "BB6648")."""
+    return parse_endpoint(value)[0] or value.upper()
+
+
+def _canonical_equipment_type(value):
+    """Canonical equipment type for a query filter ("RU", "AIR", "rru" -> "radio"; "BB" -> "baseband")."""
+    for family_type, pattern in EQUIPMENT_TYPE_WORDS:
+        if pattern.search(value):
+            return family_type
+    return value.lower()
+
+
+def _page_bounds(page, page_size):
+    page = max(1, int(page or 1))
+    page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    return page, page_size, (page - 1) * page_size
+
+
+class AnalysisStore:
+    """
+    SQLite-backed store of analysis results, one revision per save of a diagram.
+
+    Each thread gets its own connection (sqlite3 connections are not shareable across
+    threads); WAL mode lets Flask's request threads read while another thread writes.
+    """
+
+    def __init__(self, path=ANALYSIS_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # --- Writes ---
+
+    def save_revision(self, diagram_key, results, site=None, image_url=None, metadata=None):
+        """
+        Stores one set of analysis results as the next revision of `diagram_key`.
+
+        `results` uses the DiagramIQ keys captured by the frontend: "ocr" (list of blocks,
+        or a list of per-page document results), "nodes", "edges" and "edges_fewshot".
+        Returns {"diagram_key", "revision", "revision_id"}.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO diagrams (diagram_key, site, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(diagram_key) DO UPDATE SET site = COALESCE(excluded.site, diagrams.site)",
+                (diagram_key, site, now)
+            )
+            diagram_id = conn.execute("SELECT id FROM diagrams WHERE diagram_key = ?", (diagram_key,)).fetchone()["id"]
+            revision = conn.execute(
+                "SELECT COALESCE(MAX(revision), 0) + 1 FROM revisions WHERE diagram_id = ?", (diagram_id,)
+            ).fetchone()[0]
+            revision_id = conn.execute(
+                "INSERT INTO revisions (diagram_id, revision, image_url, metadata, created_at) VALUES (?, ?, ?, ?, ?)",
+                (diagram_id, revision, image_url, json.dumps(metadata) if metadata else None, now)
+            ).lastrowid
+
+            self._insert_ocr(conn, revision_id, results.get("ocr"))
+            self._insert_nodes(conn, revision_id, results)
+            self._insert_edges(conn, revision_id, results)
+
+            conn.execute("UPDATE diagrams SET latest_revision_id = ? WHERE id = ?", (revision_id, diagram_id))
+        return {"diagram_key": diagram_key, "revision": revision, "revision_id": revision_id}
+
+    def _insert_ocr(self, conn, revision_id, ocr_result):
+        rows = []
+        for item in extract_items(ocr_result, "blocks"):
+            if "results" in item and "page" in item:
+                # Per-page result from /analyze/document.
+                for block in (item["results"].get("ocr") or []):
+                    rows.append((revision_id, item["page"], block.get("block_num"), block.get("text", ""), json.dumps(block.get("words", []))))
+            elif isinstance(item, dict) and "text" in item:
+                rows.append((revision_id, item.get("page", 1), item.get("block_num"), item["text"], json.dumps(item.get("words", []))))
+        for row in rows:
+            block_id = conn.execute(
+                "INSERT INTO ocr_blocks (revision_id, page, block_num, text, words) VALUES (?, ?, ?, ?, ?)", row
+            ).lastrowid
+            conn.execute("INSERT INTO ocr_blocks_fts (rowid, text) VALUES (?, ?)", (block_id, row[3]))
+
+    def _insert_nodes(self, conn, revision_id, results):
+        rows = []
+        for node in extract_items(results.get("nodes"), "nodes"):
+            label = str(node.get("label") or node.get("name") or "") if isinstance(node, dict) else str(node)
+            equipment, equipment_type, _ = parse_endpoint(label)
+            rows.append((revision_id, "nodes", label, equipment, equipment_type, json.dumps(node)))
+        conn.executemany(
+            "INSERT INTO nodes (revision_id, source_tool, label, equipment, equipment_type, data) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def _insert_edges(self, conn, revision_id, results):
+        for tool in ("edges", "edges_fewshot"):
+            for edge in extract_items(results.get(tool), "edges"):
+                if not isinstance(edge, dict):
+                    continue
+                source, target = str(edge.get("source", "")), str(edge.get("target", ""))
+                edge_id = conn.execute(
+                    "INSERT INTO edges (revision_id, source_tool, source, target, data) VALUES (?, ?, ?, ?, ?)",
+                    (revision_id, tool, source, target, json.dumps(edge))
+                ).lastrowid
+                for side, text in (("source", source), ("target", target)):
+                    equipment, equipment_type, port = parse_endpoint(text, edge.get(f"{side}_port"))
+                    conn.execute(
+                        "INSERT INTO port_refs (edge_id, revision_id, side, equipment, equipment_type, port) VALUES (?, ?, ?, ?, ?, ?)",
+                        (edge_id, revision_id, side, equipment, equipment_type, port)
+                    )
+
+    # --- Reads ---
+
+    def get_revision(self, diagram_key, revision=None):
+        """Returns the stored results for a diagram revision (latest by default), or None."""
+        conn = self._connection()
+        params = [diagram_key]
+        revision_filter = "r.id = d.latest_revision_id"
+        if revision is not None:
+            revision_filter = "r.revision = ?"
+            params.append(int(revision))
+        row = conn.execute(
+            "SELECT r.id, r.revision, r.image_url, r.metadata, r.created_at, d.site FROM diagrams d "
+            f"JOIN revisions r ON r.diagram_id = d.id WHERE d.diagram_key = ? AND {revision_filter}",
+            params
+        ).fetchone()
+        if row is None:
+            return None
+
+        revision_id = row["id"]
+        ocr = [
+            {"page": b["page"], "block_num": b["block_num"], "text": b["text"], "words": json.loads(b["words"] or "[]")}
+            for b in conn.execute("SELECT * FROM ocr_blocks WHERE revision_id = ? ORDER BY id", (revision_id,))
+        ]
+        nodes = [json.loads(n["data"]) for n in conn.execute("SELECT data FROM nodes WHERE revision_id = ? ORDER BY id", (revision_id,))]
+        edges = {}
+        for e in conn.execute("SELECT source_tool, data FROM edges WHERE revision_id = ? ORDER BY id", (revision_id,)):
+            edges.setdefault(e["source_tool"], []).append(json.loads(e["data"]))
+        return {
+            "diagram_key": diagram_key,
+            "site": row["site"],
+            "revision": row["revision"],
+            "image_url": row["image_url"],
+            "metadata": json.loads(row["metadata"]) if row["metadata"] else None,
+            "created_at": row["created_at"],
+            "ocr": ocr,
+            "nodes": nodes,
+            "edges": edges.get("edges", []),
+            "edges_fewshot": edges.get("edges_fewshot", []),
+        }
+
+    def search_text(self, query, page=1, page_size=DEFAULT_PAGE_SIZE, latest_only=True):
+        """Full-text search over OCR blocks (FTS5 query syntax), best matches first."""
+        page, page_size, offset = _page_bounds(page, page_size)
+        latest_filter = "AND r.id = d.latest_revision_id" if latest_only else ""
+        rows = self._connection().execute(
+            "SELECT d.diagram_key, d.site, r.revision, b.page, b.block_num, b.text, "
+            "snippet(ocr_blocks_fts, 0, '[', ']', '...', 12) AS snippet "
+            "FROM ocr_blocks_fts JOIN ocr_blocks b ON b.id = ocr_blocks_fts.rowid "
+            "JOIN revisions r ON r.id = b.revision_id JOIN diagrams d ON d.id = r.diagram_id "
+            f"WHERE ocr_blocks_fts MATCH ? {latest_filter} "
+            "ORDER BY ocr_blocks_fts.rank LIMIT ? OFFSET ?",
+            (_fts_query(query), page_size + 1, offset)
+        ).fetchall()
+        return _paginate([dict(r) for r in rows], page, page_size)
+
+    def find_connections(self, equipment=None, port=None, peer_equipment=None, peer_type=None,
+                         site=None, page=1, page_size=DEFAULT_PAGE_SIZE, latest_only=True):
+        """
+        Finds edges where one end matches equipment/port and the other end matches the peer filters.
+
+        e.g. find_connections(equipment="BB6648", port="RI-A", peer_type="radio") answers
+        "all sites where BB6648 RI-A connects to an RU". Edge direction is ignored.
+        """
+        page, page_size, offset = _page_bounds(page, page_size)
+        clauses, params = [], []
+        # Filters are canonicalized the same way stored endpoints are (see parse_endpoint).
+        for column, value in (("a.equipment", equipment and _canonical_equipment(equipment)),
+                              ("a.port", port and port.upper()),
+                              ("b.equipment", peer_equipment and _canonical_equipment(peer_equipment)),
+                              ("b.equipment_type", peer_type and _canonical_equipment_type(peer_type))):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if site:
+            clauses.append("d.site = ?")
+            params.append(site)
+        if latest_only:
+            clauses.append("a.revision_id = d.latest_revision_id")
+        where = " AND ".join(clauses) if clauses else "1"
+
+        rows = self._connection().execute(
+            "SELECT d.diagram_key, d.site, r.revision, e.source_tool, e.source, e.target, "
+            "a.equipment, a.port, b.equipment AS peer_equipment, b.equipment_type AS peer_type, b.port AS peer_port "
+            "FROM port_refs a JOIN port_refs b ON b.edge_id = a.edge_id AND b.side != a.side "
+            "JOIN edges e ON e.id = a.edge_id JOIN revisions r ON r.id = a.revision_id "
+            "JOIN diagrams d ON d.id = r.diagram_id "
+            # One row per edge: with symmetric filters (e.g. only site) both sides would match as "a".
+            f"WHERE {where} GROUP BY e.id ORDER BY d.diagram_key, e.id LIMIT ? OFFSET ?",
+            params + [page_size + 1, offset]
+        ).fetchall()
+        return _paginate([dict(r) for r in rows], page, page_size)
+
+    def list_diagrams(self, site=None, page=1, page_size=DEFAULT_PAGE_SIZE):
+        page, page_size, offset = _page_bounds(page, page_size)
+        site_filter, params = ("WHERE d.site = ?", [site]) if site else ("", [])
+        rows = self._connection().execute(
+            "SELECT d.diagram_key, d.site, r.revision AS latest_revision, r.created_at AS updated_at "
+            f"FROM diagrams d LEFT JOIN revisions r ON r.id = d.latest_revision_id {site_filter} "
+            "ORDER BY d.diagram_key LIMIT ? OFFSET ?",
+            params + [page_size + 1, offset]
+        ).fetchall()
+        return _paginate([dict(r) for r in rows], page, page_size)
+
+
+def _paginate(rows, page, page_size):
+    """Queries fetch one extra row so has_more is known without a COUNT(*) over the whole table."""
+    return {
+        "items": rows[:page_size],
+        "page": page,
+        "page_size": page_size,
+        "has_more": len(rows) > page_size,
+    }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_analysis_store():
+    """Returns the process-wide AnalysisStore, creating the database on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AnalysisStore()
+    return _store
@@ -0,0 +1,252 @@
+# backend/services/cassette.py
+import os
+import json
+import time
+import hashlib
+import datetime
+import tempfile
+import threading
+from collections import Counter
+
+import requests
+
+# --- Cassette Configuration ---
+# off:    talk to OpenAI / GCS / image URLs directly (default)
+# record: serve responses already in the cassette, call out (and save the response) for the rest
+# replay: serve saved responses only; nothing leaves the machine
+CASSETTE_MODES = ("off", "record", "replay")
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "cassettes"))
+# Replayed responses wait latency_ms * scale before returning: 1.0 = as recorded, 0 = instant (warm-cache demos).
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1.0"))
+# ------------------------------
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when no recording matches the request."""
+
+
+def request_fingerprint(request):
+    """Stable SHA-256 of a JSON-able request description (dict key order doesn't matter)."""
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Recorded interactions for one kind of call ("llm", "storage", "http"), kept in
+    `<directory>/<name>.jsonl`: one line per request fingerprint with its latency and response.
+
+    Only the fingerprint of a request is stored, not the request itself, so prompts carrying
+    inline images don't bloat the cassette. Large binary bodies go in `<directory>/blobs/`.
+    """
+
+    def __init__(self, directory, name, mode=CASSETTE_MODE, latency_scale=CASSETTE_LATENCY_SCALE):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}'. Expected one of {CASSETTE_MODES}")
+        self.directory = directory
+        self.name = name
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self._entries = {}
+        self._lock = threading.Lock()
+        if mode in ("record", "replay") and os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["fingerprint"]] = entry  # Later recordings win.
+
+    def play(self, request, call, encode=lambda r: r, decode=lambda r: r):
+        """
+        Returns the response for `request`: replayed from the cassette, or produced by `call()`
+        (and recorded, in record mode). encode/decode convert it to and from JSON-able form.
+
+        Record mode only calls out for requests the cassette doesn't have yet, so re-running a
+        recording session appends nothing new; delete the cassette file to re-record everything.
+        """
+        if self.mode == "off":
+            return call()
+
+        fingerprint = request_fingerprint(request)
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+        if entry is not None:
+            if self.latency_scale > 0:
+                time.sleep(entry["latency_ms"] / 1000.0 * self.latency_scale)
+            return decode(entry["response"])
+        if self.mode == "replay":
+            raise CassetteMiss(f"No '{self.name}' recording for request {fingerprint[:12]} in {self.directory}")
+
+        started = time.perf_counter()
+        result = call()
+        entry = {
+            "fingerprint": fingerprint,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "response": encode(result),
+        }
+        with self._lock:
+            if fingerprint in self._entries:
+                return result  # Recorded concurrently by another thread.
+            self._entries[fingerprint] = entry
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        return result
+
+    def blob_path(self, digest):
+        return os.path.join(self.directory, "blobs", digest)
+
+    def save_blob(self, chunks):
+        """Writes an iterable of byte chunks to the blob store (never holding it whole) and returns its digest."""
+        os.makedirs(os.path.join(self.directory, "blobs"), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, "blobs"), prefix=".partial_")
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+            os.replace(tmp_path, self.blob_path(digest.hexdigest()))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return digest.hexdigest()
+
+
+# --- LLM (openai.chat) ---
+
+class CassetteChat:
+    """
+    Drop-in for `openai.chat`: `openai.chat = CassetteChat(cassette, openai.chat)` makes every
+    service's `openai.chat.completions.create(...)` go through the cassette unchanged.
+
+    Token usage of every response served (live or replayed) is accumulated in `usage`.
+    """
+
+    def __init__(self, cassette, chat=None):
+        self.cassette = cassette
+        self.chat = chat
+        self.usage = Counter()
+        self._usage_lock = threading.Lock() # /analyze/document calls create() from pool threads.
+
+    @property
+    def completions(self):
+        return self
+
+    def create(self, **kwargs):
+        from openai.types.chat import ChatCompletion
+        response = self.cassette.play(
+            kwargs,
+            call=lambda: self.chat.completions.create(**kwargs),
+            encode=lambda r: r.model_dump(mode="json"),
+            decode=ChatCompletion.model_validate,
+        )
+        if response.usage:
+            with self._usage_lock:
+                self.usage["prompt_tokens"] += response.usage.prompt_tokens
+                self.usage["completion_tokens"] += response.usage.completion_tokens
+                self.usage["total_tokens"] += response.usage.total_tokens
+        return response
+
+    def take_usage(self):
+        """Returns the token usage accumulated since the last call and resets it."""
+        with self._usage_lock:
+            usage, self.usage = dict(self.usage), Counter()
+        return usage
+
+
+# --- GCS (storage.Client) ---
+
+class CassetteStorageClient:
+    """
+    Wraps a `google.cloud.storage.Client` (or stands in for one during replay) for the calls
+    the app makes: client.bucket(name).blob(name).generate_signed_url(...).
+
+    Blob names are random UUIDs per upload and the bucket comes from GCS_BUCKET_NAME, which an
+    offline replay machine may not have, so both are left out of the fingerprint: a replay
+    returns the signed URL recorded for the same method/content type.
+    """
+
+    def __init__(self, cassette, client=None):
+        self.cassette = cassette
+        self.client = client
+
+    def bucket(self, bucket_name):
+        return _CassetteBucket(self, bucket_name)
+
+
+class _CassetteBucket:
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+
+    def blob(self, blob_name):
+        return _CassetteBlob(self, blob_name)
+
+
+class _CassetteBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def generate_signed_url(self, **kwargs):
+        storage = self.bucket.storage
+        return storage.cassette.play(
+            {"op": "generate_signed_url", "kwargs": kwargs},
+            call=lambda: storage.client.bucket(self.bucket.name).blob(self.name).generate_signed_url(**kwargs),
+        )
+
+
+# --- HTTP image fetches (requests.get) ---
+
+HTTP_CHUNK_SIZE = 1024 * 1024
+
+
+def _fetch_to_blob(cassette, url, kwargs):
+    """Performs the GET and streams the body into the cassette's blob store."""
+    with requests.get(url, **dict(kwargs, stream=True)) as response:
+        return {
+            "status_code": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() in ("content-type", "content-length")},
+            "body": cassette.save_blob(response.iter_content(chunk_size=HTTP_CHUNK_SIZE)),
+        }
+
+
+def _response_from_blob(cassette, url, recorded):
+    """A requests.Response whose body is read lazily from the blob file, like a streamed download."""
+    response = requests.models.Response()
+    response.url = url
+    response.status_code = recorded["status_code"]
+    response.headers.update(recorded["headers"])
+    response.raw = open(cassette.blob_path(recorded["body"]), "rb")  # iter_content() reads it in chunks; close() closes it.
+    return response
+
+
+def http_get(url, cassette=None, **kwargs):
+    """
+    requests.get() through the "http" cassette. When recording, the body is streamed to a blob
+    file; recorded and replayed responses read their body from that file, so .iter_content()
+    stays bounded in memory and .content still works.
+    """
+    cassette = cassette or get_cassette("http")
+    if cassette.mode == "off":
+        return requests.get(url, **kwargs)
+    recorded = cassette.play(
+        {"method": "GET", "url": url},
+        call=lambda: _fetch_to_blob(cassette, url, kwargs),
+    )
+    return _response_from_blob(cassette, url, recorded)
+
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+def get_cassette(name):
+    """Returns the process-wide cassette `name`, configured from CASSETTE_MODE / CASSETTE_DIR."""
+    with _cassettes_lock:
+        if name not in _cassettes:
+            _cassettes[name] = Cassette(CASSETTE_DIR, name)
+        return _cassettes[name]
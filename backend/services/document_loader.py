@@ -0,0 +1,287 @@
+# backend/services/document_loader.py
+import os
+import re
+import math
+import tempfile
+from PIL import Image, ImageSequence, TiffImagePlugin
+
+from services.cassette import http_get
+
+# --- Ingestion Configuration ---
+DEFAULT_PDF_DPI = int(os.getenv("DOCUMENT_PDF_DPI", "200"))
+MAX_PDF_DPI = 600
+# Large PDF sheets are rasterized at a lower DPI to stay within MAX_DECODE_PIXELS, but not below this.
+MIN_PDF_DPI = 100
+# Height (in pixels) of each horizontal band a large page is split into for OCR.
+BAND_HEIGHT = int(os.getenv("DOCUMENT_BAND_HEIGHT", "2048"))
+# Bands extend this many rows above and below their core rows, so a line of text crossing a
+# band boundary is seen whole by both neighbours (see document_pipeline.ocr_page).
+BAND_OVERLAP = 128
+# Pages at or below this many pixels are processed whole instead of band by band.
+MAX_WHOLE_PAGE_PIXELS = 25_000_000
+# Pages that can't be read band by band (compressed TIFFs, PNG, JPEG) are decoded whole, which
+# costs ~3 bytes per pixel plus the band copies; larger pages are rejected instead.
+MAX_DECODE_PIXELS = int(os.getenv("DOCUMENT_MAX_DECODE_PIXELS", "64000000"))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Site packs are routinely larger than Pillow's decompression bomb default (~89 MP). Only
+# TIFFs can be read band by band, so only they are opened with this limit (see _open_image);
+# everything else, and the rest of the app, keeps Pillow's default.
+MAX_DOCUMENT_PIXELS = int(os.getenv("DOCUMENT_MAX_PIXELS", "1000000000"))
+# -------------------------------
+
+
+def download_to_tempfile(url, timeout=30):
+    """
+    Streams the document at `url` to a temporary file on disk and returns its path.
+
+    The body is written in chunks so the download never has to fit in memory, and
+    having a real file lets uncompressed rasters be read band by band.
+    The caller is responsible for deleting the file.
+    """
+    response = http_get(url, stream=True, timeout=timeout)
+    response.raise_for_status()
+
+    suffix = os.path.splitext(url.split("?", 1)[0])[1]
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="document_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        response.close()
+    return path
+
+
+def _open_image(path):
+    """
+    Opens an image file for document ingestion.
+
+    TIFFs are opened through the TIFF plugin directly, which skips Pillow's process-wide
+    decompression bomb check, and are checked against MAX_DOCUMENT_PIXELS instead. Other
+    formats go through Image.open() with its default limit.
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(4)
+    if prefix not in TiffImagePlugin.PREFIXES:
+        return Image.open(path)
+    image = TiffImagePlugin.TiffImageFile(path)
+    _check_document_pixels(image.size)
+    return image
+
+
+def _check_document_pixels(size):
+    if size[0] * size[1] > MAX_DOCUMENT_PIXELS:
+        raise ValueError(f"Image of {size[0]}x{size[1]} pixels exceeds DOCUMENT_MAX_PIXELS ({MAX_DOCUMENT_PIXELS}).")
+
+
+def _is_pdf(path):
+    with open(path, "rb") as f:
+        return f.read(5) == b"%PDF-"
+
+
+class RasterPage:
+    """
+    One frame of an image file (a single PNG/JPEG, or one page of a multi-page TIFF).
+
+    Nothing is decoded until `open()` or `iter_bands()` is called, and each call reopens
+    the file, so a page only holds pixels while it is actually being processed.
+    """
+
+    def __init__(self, path, index, frame, size):
+        self.path = path
+        self.index = index
+        self.frame = frame
+        self.width, self.height = size
+
+    def open(self):
+        _check_document_pixels((self.width, self.height))
+        image = _open_image(self.path)
+        if self.frame:
+            image.seek(self.frame)
+        return image
+
+    def load(self):
+        """Decodes the whole page and returns it as an RGB image."""
+        with self.open() as image:
+            return image.convert("RGB")
+
+    def iter_bands(self, band_height=BAND_HEIGHT, overlap=BAND_OVERLAP):
+        """
+        Yields (top, image) pairs covering the page in horizontal bands.
+
+        Each band spans [top - overlap, top + band_height + overlap), clipped to the page.
+        Uncompressed striped TIFFs are read band by band straight from the file, so only one
+        band is ever in memory. Anything else (compressed TIFFs, PNG, JPEG) can only be decoded
+        whole, which is refused above MAX_DECODE_PIXELS.
+        """
+        if self.width * self.height <= MAX_WHOLE_PAGE_PIXELS:
+            yield 0, self.load()
+            return
+
+        with self.open() as image:
+            strips = _raw_strip_layout(image)
+        if strips is None:
+            if self.width * self.height > MAX_DECODE_PIXELS:
+                raise ValueError(
+                    f"Page {self.index + 1} is {self.width}x{self.height} and can't be read band by band "
+                    f"(only uncompressed striped TIFFs can); decoding it whole exceeds DOCUMENT_MAX_DECODE_PIXELS "
+                    f"({MAX_DECODE_PIXELS}). Save it as an uncompressed TIFF or split it into smaller pages."
+                )
+            image = self.load()
+            try:
+                for top in range(0, self.height, band_height):
+                    yield top, image.crop((0, max(0, top - overlap), self.width, min(top + band_height + overlap, self.height)))
+            finally:
+                image.close()
+            return
+
+        with open(self.path, "rb") as f:
+            for top in range(0, self.height, band_height):
+                band_top = max(0, top - overlap)
+                band_bottom = min(top + band_height + overlap, self.height)
+                band = _read_raw_rows(f, strips, band_top, band_bottom)
+                yield top, band if band.mode == "RGB" else band.convert("RGB")
+
+    def thumbnail(self, max_side):
+        """Returns an RGB copy of the page scaled to fit within max_side, built band by band."""
+        scale = min(1.0, float(max_side) / max(self.width, self.height))
+        size = (max(1, int(self.width * scale)), max(1, int(self.height * scale)))
+        if self.width * self.height <= MAX_WHOLE_PAGE_PIXELS:
+            return self.load().resize(size, Image.LANCZOS)
+
+        canvas = Image.new("RGB", size, "white")
+        for top, band in self.iter_bands(overlap=0):
+            band_size = (size[0], max(1, int(band.height * scale)))
+            canvas.paste(band.resize(band_size, Image.LANCZOS), (0, int(top * scale)))
+        return canvas
+
+
+def _raw_strip_layout(image):
+    """
+    Returns the strip layout of an uncompressed, chunky, top-down TIFF frame as a dict
+    (mode, rawmode, stride, rows_per_strip, offsets), or None if the frame isn't one.
+
+    Built from the StripOffsets/RowsPerStrip tags rather than `image.tile`, because Pillow
+    reports a whole page as a single tile whatever its strip layout.
+    """
+    if image.format != "TIFF" or len(image.tile) != 1 or image.mode == "P":
+        return None # Palette images would lose their palette in Image.frombytes
+    tile = image.tile[0]
+    tags = image.tag_v2
+    if (tile[0] != "raw" or tags.get(259, 1) != 1 or tags.get(284, 1) != 1 # Compression, PlanarConfiguration
+            or tags.get(273) is None or (len(tile[3]) > 2 and tile[3][2] != 1)): # StripOffsets, orientation
+        return None
+    bits = tags.get(258, 1) # BitsPerSample
+    bits_per_pixel = sum(bits) if isinstance(bits, tuple) else bits * tags.get(277, 1)
+    offsets = tags[273] if isinstance(tags[273], tuple) else (tags[273],)
+    return {
+        "mode": image.mode,
+        "rawmode": tile[3][0],
+        "stride": (image.width * bits_per_pixel + 7) // 8,
+        "rows_per_strip": min(tags.get(278, image.height), image.height),
+        "offsets": offsets,
+        "width": image.width,
+    }
+
+
+def _read_raw_rows(f, strips, top, bottom):
+    """Reads rows [top, bottom) of an uncompressed TIFF frame from the open file `f`."""
+    stride, rows_per_strip = strips["stride"], strips["rows_per_strip"]
+    data = bytearray((bottom - top) * stride)
+    view = memoryview(data)
+    row = top
+    while row < bottom:
+        strip = row // rows_per_strip
+        strip_end = min((strip + 1) * rows_per_strip, bottom)
+        f.seek(strips["offsets"][strip] + (row - strip * rows_per_strip) * stride)
+        f.readinto(view[(row - top) * stride:(strip_end - top) * stride])
+        row = strip_end
+    view.release()
+    return Image.frombytes(strips["mode"], (strips["width"], bottom - top), data, "raw", strips["rawmode"], stride)
+
+
+class PdfPage:
+    """
+    One page of a PDF, rasterized with poppler (via pdf2image) only when requested.
+
+    `points` is the page size in PostScript points (from pdfinfo). The page is rasterized at
+    the requested DPI, lowered as far as MIN_PDF_DPI if that would exceed MAX_DECODE_PIXELS.
+    """
+
+    def __init__(self, path, index, dpi, points=None):
+        self.path = path
+        self.index = index
+        self.dpi = dpi
+        self.width = None
+        self.height = None
+        if points:
+            pixels_at_dpi = (points[0] / 72.0 * dpi) * (points[1] / 72.0 * dpi)
+            if pixels_at_dpi > MAX_DECODE_PIXELS:
+                self.dpi = max(MIN_PDF_DPI, int(dpi * math.sqrt(MAX_DECODE_PIXELS / pixels_at_dpi)))
+                print(f"PDF page {index + 1} is {points[0]:.0f}x{points[1]:.0f} pt; rasterizing at {self.dpi} DPI instead of {dpi}.")
+            self.width = int(points[0] / 72.0 * self.dpi)
+            self.height = int(points[1] / 72.0 * self.dpi)
+
+    def load(self):
+        from pdf2image import convert_from_path
+        if self.width and self.width * self.height > MAX_DECODE_PIXELS:
+            raise ValueError(
+                f"PDF page {self.index + 1} would be {self.width}x{self.height} pixels even at {self.dpi} DPI, "
+                f"which exceeds DOCUMENT_MAX_DECODE_PIXELS ({MAX_DECODE_PIXELS})."
+            )
+        # first_page/last_page are 1-based; poppler rasterizes only this page.
+        image = convert_from_path(self.path, dpi=self.dpi, first_page=self.index + 1, last_page=self.index + 1)[0]
+        self.width, self.height = image.size
+        return image.convert("RGB")
+
+    def iter_bands(self, band_height=BAND_HEIGHT, overlap=BAND_OVERLAP):
+        image = self.load()
+        if image.width * image.height <= MAX_WHOLE_PAGE_PIXELS:
+            yield 0, image
+            return
+        for top in range(0, image.height, band_height):
+            yield top, image.crop((0, max(0, top - overlap), image.width, min(top + band_height + overlap, image.height)))
+
+    def thumbnail(self, max_side):
+        from pdf2image import convert_from_path
+        # An int size makes poppler scale the longest side to max_side while rasterizing.
+        image = convert_from_path(self.path, size=max_side, first_page=self.index + 1, last_page=self.index + 1)[0]
+        return image.convert("RGB")
+
+
+def _pdf_page_points(path, page_number):
+    """(width, height) of one PDF page in points, or None if pdfinfo doesn't report it."""
+    from pdf2image import pdfinfo_from_path
+    info = pdfinfo_from_path(path, first_page=page_number, last_page=page_number)
+    for key, value in info.items():
+        if re.match(r"^Page\s+(\d+\s+)?size$", str(key).strip()):
+            match = re.match(r"\s*([\d.]+) x ([\d.]+)", str(value))
+            if match:
+                return float(match.group(1)), float(match.group(2))
+    return None
+
+
+def iter_document_pages(path, dpi=DEFAULT_PDF_DPI):
+    """
+    Lazily yields page objects for a PDF, multi-page TIFF or single image at `path`.
+
+    Only page metadata is read here; pixels are decoded by the page's load()/iter_bands()
+    so callers control how many pages are resident at once.
+    """
+    dpi = max(1, min(int(dpi), MAX_PDF_DPI))
+    if _is_pdf(path):
+        from pdf2image import pdfinfo_from_path
+        page_count = int(pdfinfo_from_path(path)["Pages"])
+        for index in range(page_count):
+            yield PdfPage(path, index, dpi, _pdf_page_points(path, index + 1))
+        return
+
+    with _open_image(path) as image:
+        sizes = [frame.size for frame in ImageSequence.Iterator(image)]
+    for index, size in enumerate(sizes):
+        yield RasterPage(path, index, index, size)
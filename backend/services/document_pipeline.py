@@ -0,0 +1,97 @@
+# backend/services/document_pipeline.py
+import base64
+import io
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from services.ocr_engine import extract_text_blocks
+from services.document_loader import BAND_HEIGHT, BAND_OVERLAP
+
+# Longest side of the page image sent to the LLM tools (the model downsamples beyond this anyway).
+LLM_IMAGE_MAX_SIDE = 2048
+DEFAULT_MAX_WORKERS = 2
+
+
+def ocr_page(page, band_height=BAND_HEIGHT, overlap=BAND_OVERLAP):
+    """
+    Runs OCR over a document page band by band and returns blocks in page coordinates.
+
+    Bands overlap their neighbours by `overlap` rows on both sides. A word is kept only by the
+    band whose core rows [top, top + band_height) contain its top edge, so a line crossing a
+    band boundary is read whole by the band above and its fragments in the band below (which
+    fall in that band's leading overlap) are dropped.
+    """
+    result = []
+    for top, band in page.iter_bands(band_height=band_height, overlap=overlap):
+        band_top = max(0, top - overlap)
+        # Judged by core rows: the band before the last can also reach the page end via its overlap.
+        is_last_band = top + band_height >= page.height
+        for block in extract_text_blocks(band, cache=False): # Bands are one-off; don't evict whole diagrams
+            words = []
+            for word in block["words"]:
+                word_top = word["top"] + band_top
+                if word_top < top:
+                    continue  # Leading overlap: the band above reports it.
+                if word_top >= top + band_height and not is_last_band:
+                    continue  # Trailing overlap: the band below reports it.
+                words.append(dict(word, top=word_top))
+            if not words:
+                continue
+            result.append({
+                "block_num": len(result) + 1,
+                "text": " ".join(w["text"] for w in sorted(words, key=lambda x: (x["top"], x["left"]))),
+                "words": words
+            })
+        band.close()
+    return result
+
+
+def page_image_data_url(page, max_side=LLM_IMAGE_MAX_SIDE):
+    """Encodes a downscaled copy of the page as a PNG data URL for the vision LLM tools."""
+    image = page.thumbnail(max_side)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _run_page(page, tools):
+    """Runs every requested tool on one page; a failing tool is reported without failing the page."""
+    started = time.perf_counter()
+    page_result = {"page": page.index + 1, "results": {}, "errors": {}}
+    for tool_id, tool in tools.items():
+        try:
+            page_result["results"][tool_id] = tool(page)
+        except Exception as e:
+            print(f"Error running '{tool_id}' on page {page.index + 1}: {e}")
+            traceback.print_exc()
+            page_result["errors"][tool_id] = str(e)
+    page_result["width"], page_result["height"] = page.width, page.height
+    page_result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return page_result
+
+
+def stream_page_results(pages, tools, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Processes pages concurrently and yields each page's results as soon as it completes.
+
+    `pages` is consumed lazily and at most `max_workers` pages are in flight at a time,
+    so peak memory is bounded by the worker count rather than the document's page count.
+    Results are yielded in completion order; each carries its 1-based "page" number.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = set()
+    try:
+        for page in pages:
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(_run_page, page, tools))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        # If the client disconnects mid-stream, don't start pages nobody will read.
+        executor.shutdown(wait=True, cancel_futures=True)
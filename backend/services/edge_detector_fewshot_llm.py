@@ -28,7 +28,7 @@ def detect_edges_fewshot(image_url: str, reference_context: str):
         # return {"error": "Reference context is missing for few-shot detection."}
 
     try:
-        print(f"Sending image to LLM for Few-Shot Edge Detection: {image_url}")
+        print(f"Sending image to LLM for Few-Shot Edge Detection: {image_url if not image_url.startswith('data:') else '<inline image data>'}")
 
         # Note: Token management (like truncation) is handled before calling this function
         # in the API layer for now, but could be moved here if desired.
@@ -0,0 +1,58 @@
+import os
+import openai
+import json
+
+# Ensure API key is loaded (usually done in the main app, but good practice)
+if not openai.api_key:
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+
+def detect_nodes_llm(image_url: str):
+    """
+    Detects equipment nodes in a diagram using an LLM.
+
+    Args:
+        image_url: The publicly accessible URL (or data URL) of the diagram image.
+
+    Returns:
+        The parsed JSON object returned by the model.
+        Example: {"nodes": [{"id": 1, "label": "Pump P-101"}]}
+
+    Raises:
+        json.JSONDecodeError if the model does not return valid JSON (the raw
+        response is available as the exception's `doc` attribute), and any
+        OpenAI errors unchanged so the API layer can map them to status codes.
+    """
+    print(f"Sending image to LLM for Node Detection: {image_url if not image_url.startswith('data:') else '<inline image data>'}")
+
+    system_msg = {
+        "role": "system",
+        "content": (
+            "You are an expert system analyzing engineering diagrams (like P&IDs or flowcharts). "
+            "Your task is to identify distinct equipment nodes or components shown in the diagram. "
+            "List each identified node with a brief label or description. "
+            "Format the output as a JSON list of objects, where each object has a 'id' (sequential number starting from 1) and a 'label' (the identified node description)."
+            "Example Output: [{'id': 1, 'label': 'Pump P-101'}, {'id': 2, 'label': 'Heat Exchanger E-203'}, {'id': 3, 'label': 'Storage Tank T-50'}]"
+        )
+    }
+    user_msg = {
+        "role": "user",
+        "content": [
+            #{"type": "text", "text": "Identify the equipment nodes in the diagram at this URL and provide the output in the specified JSON format:"},
+            {"type": "text", "text": "The diagram is provided via a url. Identify the equipment nodes in the diagram. Provide the output in the specified JSON format:"},
+            {
+                "type": "image_url",
+                "image_url": {"url": image_url},
+            },
+        ]
+    }
+
+    resp = openai.chat.completions.create(
+        model="gpt-4o-mini", # Or your preferred model
+        messages=[system_msg, user_msg],
+        response_format={ "type": "json_object" } # Request JSON output
+        # max_tokens=500 # Optional
+    )
+
+    node_results_json_string = resp.choices[0].message.content
+    print(f"LLM Node Detection Raw Response: {node_results_json_string}")
+    return json.loads(node_results_json_string)
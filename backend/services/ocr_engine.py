@@ -1,31 +1,190 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import pytesseract
+from PIL import Image, ImageOps
+
+MIN_CONFIDENCE = 50
+# Full-page Tesseract output is cached per image hash; entries are dicts of lists, roughly 100 bytes per word.
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "32"))
+# Second pass: low-confidence words are cropped, upscaled and re-read as a single text line.
+REOCR_SCALE = 3
+REOCR_PADDING = 0.35 # Fraction of the word height added around the crop
+REOCR_MAX_WORDS = 200
+REOCR_WORKERS = int(os.getenv("OCR_REOCR_WORKERS", "4"))
+REOCR_PSM = 7 # Treat the crop as a single text line; port labels like "TN/IDL-B" are one "word"
+# Words that look like port/equipment labels ("RI-A", "TN/IDL-B", "BB6648") get the whitelisted re-read.
+LABEL_PATTERN = re.compile(r"^[A-Za-z0-9]+(?:[-/][A-Za-z0-9]+)+$|^[A-Z0-9]{2,10}$")
+HASH_ROWS = 256 # Rows hashed at a time, so the cache key never needs a full copy of the raster
+
+_page_cache = OrderedDict()
+_page_cache_lock = threading.Lock()
+
+
+def image_hash(image):
+    """Content hash of a PIL image (mode, size and pixels), used as the OCR cache key."""
+    digest = hashlib.sha256(f"{image.mode}:{image.size}".encode("ascii"))
+    for top in range(0, image.height, HASH_ROWS):
+        digest.update(image.crop((0, top, image.width, min(top + HASH_ROWS, image.height))).tobytes())
+    return digest.hexdigest()
+
+
+def _full_page_data(image, cache_key=None, cache=True):
+    """
+    Tesseract image_to_data for the whole page, served from the cache when this image was seen before.
+
+    `cache_key` identifies the image (e.g. a hash of the downloaded file) and defaults to
+    image_hash(image); cache=False bypasses the cache (for one-off inputs such as document bands).
+    """
+    if not cache:
+        return pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    key = cache_key or image_hash(image)
+    with _page_cache_lock:
+        data = _page_cache.get(key)
+        if data is not None:
+            _page_cache.move_to_end(key)
+            return data
 
-def extract_text_blocks(image):
     data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    with _page_cache_lock:
+        _page_cache[key] = data
+        while len(_page_cache) > OCR_CACHE_SIZE:
+            _page_cache.popitem(last=False)
+    return data
+
+
+def _word(data, i, **overrides):
+    word = {
+        "text": data["text"][i].strip(),
+        "left": data["left"][i],
+        "top": data["top"][i],
+        "width": data["width"][i],
+        "height": data["height"][i],
+        "conf": data["conf"][i]
+    }
+    word.update(overrides)
+    return word
+
+
+def _group_blocks(words_by_block):
+    result = []
+    for block_num, words in words_by_block.items():
+        result.append({
+            "block_num": block_num,
+            "text": " ".join(w["text"] for w in sorted(words, key=lambda x: (x["top"], x["left"]))),
+            "words": words
+        })
+    return result
+
+
+def extract_text_blocks(image, cache_key=None, cache=True):
+    data = _full_page_data(image, cache_key, cache)
 
     blocks = {}
     for i in range(len(data["text"])):
         text = data["text"][i].strip()
-        if not text or float(data["conf"][i]) < 50:
+        if not text or float(data["conf"][i]) < MIN_CONFIDENCE:
             continue
         block = data["block_num"][i]
         if block not in blocks:
             blocks[block] = []
-        blocks[block].append({
-            "text": text,
-            "left": data["left"][i],
-            "top": data["top"][i],
-            "width": data["width"][i],
-            "height": data["height"][i],
-            "conf": data["conf"][i]
-        })
+        blocks[block].append(_word(data, i))
 
-    result = []
-    for block_num, words in blocks.items():
-        result.append({
-            "block_num": block_num,
-            "text": " ".join(w["text"] for w in sorted(words, key=lambda x: (x["top"], x["left"]))),
-            "words": words
-        })
+    return _group_blocks(blocks)
 
-    return result
+
+def _reocr_config(vocabulary=None):
+    config = f"--psm {REOCR_PSM}"
+    if vocabulary:
+        # Restrict to characters that occur in the domain labels; shell-safe by construction.
+        chars = sorted({c for token in vocabulary for c in token if c.isalnum() or c in "-/"})
+        config += f" -c tessedit_char_whitelist={''.join(chars)}"
+    return config
+
+
+def _reocr_word(image, box, config):
+    """Re-reads one word region at REOCR_SCALE; returns (text, conf) or (None, -1)."""
+    left, top, width, height = box
+    pad = max(2, int(height * REOCR_PADDING))
+    crop = image.crop((max(0, left - pad), max(0, top - pad),
+                       min(image.width, left + width + pad), min(image.height, top + height + pad)))
+    crop = ImageOps.grayscale(crop).resize((crop.width * REOCR_SCALE, crop.height * REOCR_SCALE), Image.LANCZOS)
+    data = pytesseract.image_to_data(crop, config=config, output_type=pytesseract.Output.DICT)
+
+    texts, confs = [], []
+    for text, conf in zip(data["text"], data["conf"]):
+        if text.strip() and float(conf) >= 0:
+            texts.append(text.strip())
+            confs.append(float(conf))
+    if not texts:
+        return None, -1
+    return "".join(texts), min(confs)
+
+
+def _reocr_candidate(image, box, first_text, plain_config, label_config, trusted_labels):
+    """
+    Second-pass result for one low-confidence word: (text, conf), or (None, -1) to drop it.
+
+    Every word is re-read without a character whitelist and kept if that read is confident or is
+    a known label. Only label-like words get a further whitelisted read, which is kept solely on
+    an exact vocabulary match, so ordinary words are never forced into the label alphabet.
+    """
+    text, conf = _reocr_word(image, box, plain_config)
+    if text and text.upper() in trusted_labels:
+        return text, conf
+    if label_config and (LABEL_PATTERN.match(first_text) or (text and LABEL_PATTERN.match(text))):
+        label_text, label_conf = _reocr_word(image, box, label_config)
+        if label_text and label_text.upper() in trusted_labels:
+            return label_text, label_conf
+    if text and conf >= MIN_CONFIDENCE:
+        return text, conf
+    return None, -1
+
+
+def extract_text_blocks_two_pass(image, whitelist=None, cache_key=None, cache=True):
+    """
+    Like extract_text_blocks, but words the full-page pass read below MIN_CONFIDENCE get a
+    second, label-tuned attempt instead of being dropped.
+
+    Each low-confidence word region is cropped, upscaled REOCR_SCALE times and re-read as a
+    single line (in parallel). `whitelist` is an optional list of domain labels (e.g. reference
+    port ids such as "RI-A", "TN/IDL-B"): label-like words are also re-read restricted to the
+    labels' characters, and a re-read that exactly matches one of the (non-numeric) labels is
+    accepted even below MIN_CONFIDENCE. Improved words are marked with "reocr": True.
+    """
+    data = _full_page_data(image, cache_key, cache)
+    vocabulary = {token.strip().upper() for token in (whitelist or []) if token and token.strip()}
+    plain_config = _reocr_config()
+    label_config = _reocr_config(vocabulary) if vocabulary else None
+    # Bare numbers (router port "10") are too easy to hallucinate from noise to accept on a match alone.
+    trusted_labels = {token for token in vocabulary if not token.isdigit()}
+
+    blocks, retries = {}, []
+    for i in range(len(data["text"])):
+        text = data["text"][i].strip()
+        if not text:
+            continue
+        conf = float(data["conf"][i])
+        if conf >= MIN_CONFIDENCE:
+            blocks.setdefault(data["block_num"][i], []).append(_word(data, i))
+        elif conf >= 0 and len(retries) < REOCR_MAX_WORDS:
+            retries.append(i)
+
+    if retries:
+        def reread(i):
+            box = (data["left"][i], data["top"][i], data["width"][i], data["height"][i])
+            return _reocr_candidate(image, box, data["text"][i].strip(), plain_config, label_config, trusted_labels)
+
+        with ThreadPoolExecutor(max_workers=REOCR_WORKERS) as executor:
+            rereads = list(executor.map(reread, retries))
+        for i, (text, conf) in zip(retries, rereads):
+            if text:
+                blocks.setdefault(data["block_num"][i], []).append(_word(data, i, text=text, conf=conf, reocr=True))
+
+    print(f"Two-pass OCR: re-read {len(retries)} low-confidence words, recovered "
+          f"{sum(1 for words in blocks.values() for w in words if w.get('reocr'))}.")
+    return _group_blocks(dict(sorted(blocks.items())))
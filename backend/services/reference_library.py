@@ -0,0 +1,359 @@
+# backend/services/reference_library.py
+import os
+import json
+import time
+import struct
+import hashlib
+import datetime
+import threading
+import functools
+import weakref
+from collections import OrderedDict
+
+# --- Reference Library Configuration ---
+REFERENCE_PATH = os.getenv(
+    "REFERENCE_MATERIAL_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "reference_material")
+)
+REFERENCE_RELOAD_INTERVAL = float(os.getenv("REFERENCE_RELOAD_INTERVAL", "2.0")) # Seconds between change checks
+# Share one copy of the library between all worker processes on a host (POSIX shared memory).
+REFERENCE_SHARED_MEMORY = os.getenv("REFERENCE_SHARED_MEMORY", "1") != "0"
+REFERENCE_EXTENSIONS = (".md",)
+# ---------------------------------------
+
+# Shared segment layout: 8-byte header length (written last, so 0 means "still being written"),
+# a JSON header {"version", "files": [[name, start, end], ...]}, then the concatenated file bytes.
+_HEADER_LENGTH = struct.Struct("<Q")
+_SEGMENT_READY_TIMEOUT = 2.0
+_SEGMENT_PREFIX = "diq_ref_"
+_SHM_DIR = "/dev/shm" # Where Linux exposes POSIX shared memory names; used to find stale segments.
+
+
+class ReferenceSnapshot:
+    """
+    An immutable, versioned view of every reference file at one point in time.
+
+    `version` is a hash of the file names and contents, so every worker (and every host)
+    derives the same version for the same material and caches can key on it.
+    """
+
+    __slots__ = ("version", "files", "loaded_at", "_buffer", "_index", "_segment")
+
+    def __init__(self, version, index, buffer, segment=None):
+        self.version = version
+        self.files = tuple(name for name, _, _ in index)
+        self.loaded_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self._index = {name: (start, end) for name, start, end in index}
+        self._buffer = buffer
+        self._segment = segment # Keeps the shared memory mapping open while the snapshot is in use.
+
+    def text(self, name):
+        """Returns the contents of one reference file (relative path, e.g. 'site_reference.md')."""
+        start, end = self._index[name]
+        return bytes(self._buffer[start:end]).decode("utf-8")
+
+    @property
+    def content(self):
+        """All reference files concatenated in name order, as sent to the few-shot prompt."""
+        return "\n\n".join(self.text(name) for name in self.files)
+
+    def __eq__(self, other):
+        return isinstance(other, ReferenceSnapshot) and other.version == self.version
+
+    def __hash__(self):
+        return hash(self.version)
+
+    def describe(self):
+        return {"version": self.version, "files": list(self.files), "loaded_at": self.loaded_at}
+
+
+def _list_reference_files(path):
+    if os.path.isfile(path):
+        return [(os.path.basename(path), path)]
+    found = []
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            if filename.endswith(REFERENCE_EXTENSIONS):
+                full_path = os.path.join(root, filename)
+                found.append((os.path.relpath(full_path, path).replace(os.sep, "/"), full_path))
+    return sorted(found)
+
+
+def _build_payload(files):
+    """Reads the files and returns (version, index, payload bytes)."""
+    index, chunks, offset = [], [], 0
+    digest = hashlib.sha256()
+    for name, full_path in files:
+        with open(full_path, "rb") as f:
+            data = f.read()
+        digest.update(name.encode("utf-8") + b"\0" + data + b"\0")
+        index.append((name, offset, offset + len(data)))
+        chunks.append(data)
+        offset += len(data)
+    return digest.hexdigest()[:16], index, b"".join(chunks)
+
+
+def extract_port_ids(markdown):
+    """
+    Returns the port ids ("RI-A", "TN/IDL-B", "POWER-A", ...) from every port definitions table,
+    i.e. markdown tables whose first header cell is "id". Connection example tables are skipped.
+    """
+    port_ids, in_port_table = [], False
+    for line in markdown.splitlines():
+        line = line.strip()
+        if not line.startswith("|"):
+            in_port_table = False
+            continue
+        cells = [cell.strip() for cell in line.strip("|").split("|")]
+        if cells[0].lower() == "id":
+            in_port_table = True
+        elif in_port_table and cells[0] and not set(cells[0]) <= set("-:"):
+            if cells[0] not in port_ids:
+                port_ids.append(cells[0])
+    return port_ids
+
+
+def per_version_cache(maxsize=8):
+    """
+    Like functools.lru_cache for a function of one snapshot, but keyed on snapshot.version so
+    the cache doesn't keep old snapshots (and their shared memory mappings) alive.
+    """
+    def decorator(fn):
+        cache, lock = OrderedDict(), threading.Lock()
+
+        @functools.wraps(fn)
+        def wrapper(snapshot):
+            with lock:
+                if snapshot.version in cache:
+                    cache.move_to_end(snapshot.version)
+                    return cache[snapshot.version]
+            value = fn(snapshot)
+            with lock:
+                cache[snapshot.version] = value
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+
+class ReferenceLibrary:
+    """
+    Holds the current ReferenceSnapshot of a reference file or directory and swaps in a new one
+    when the files change.
+
+    Readers call snapshot(), which is a single attribute read: a reload builds the new snapshot
+    completely and then replaces the reference, so the request path never takes a lock.
+
+    The watcher thread belongs to the process that started it. A forked worker (e.g. gunicorn
+    --preload) starts its own on its first snapshot() call.
+    """
+
+    def __init__(self, path=REFERENCE_PATH, use_shared_memory=REFERENCE_SHARED_MEMORY):
+        self.path = path
+        self.use_shared_memory = use_shared_memory
+        self._snapshot = None
+        self._signature = None
+        self._segment_name = None
+        self._reload_lock = threading.Lock()
+        self._watcher_lock = threading.Lock()
+        self._watch_interval = 0
+        self._watcher_pid = None
+        if hasattr(os, "register_at_fork"):
+            library = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: library() is not None and library()._after_fork())
+
+    def snapshot(self):
+        if self._watch_interval > 0 and self._watcher_pid != os.getpid():
+            self._start_watcher()
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.reload()
+            snapshot = self._snapshot
+        return snapshot
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    def _file_signature(self, files):
+        signature = []
+        for name, full_path in files:
+            stat = os.stat(full_path)
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def reload(self, force=False):
+        """Rebuilds the snapshot if any file was added, removed or modified. Returns True if it swapped."""
+        with self._reload_lock:
+            try:
+                files = _list_reference_files(self.path) if os.path.exists(self.path) else []
+                signature = self._file_signature(files)
+            except OSError as e:
+                print(f"Error scanning reference material at {self.path}: {e}")
+                return False
+            if signature == self._signature and self._snapshot is not None and not force:
+                return False
+            if not files:
+                print(f"Warning: No reference material found at {self.path}. Few-shot endpoint will lack context.")
+
+            previous_segment = self._segment_name
+            snapshot, segment_name = self._load(files, signature)
+            self._snapshot, self._signature, self._segment_name = snapshot, signature, segment_name
+            print(f"Loaded reference material version {snapshot.version} ({len(snapshot.files)} files) from: {self.path}")
+
+        if previous_segment and previous_segment != segment_name:
+            # Workers still holding the old snapshot keep their mapping; this only removes the name.
+            _unlink_segment(previous_segment)
+        return True
+
+    def _load(self, files, signature):
+        if self.use_shared_memory:
+            # Named after the file signature (not the contents) so other workers can attach
+            # without reading the files first.
+            segment_prefix = self._segment_prefix()
+            segment_name = segment_prefix + hashlib.sha1(repr(signature).encode("utf-8")).hexdigest()[:16]
+            try:
+                snapshot = _attach_segment(segment_name)
+                if snapshot is None:
+                    snapshot = _create_segment(segment_name, *_build_payload(files))
+                _unlink_stale_segments(segment_prefix, keep=segment_name)
+                return snapshot, segment_name
+            except Exception as e:
+                print(f"Warning: Shared memory unavailable for reference material ({e}). Using a per-process copy.")
+        version, index, payload = _build_payload(files)
+        return ReferenceSnapshot(version, index, payload), None
+
+    def _segment_prefix(self):
+        # Segments of one reference path share a prefix, so stale ones can be found and removed.
+        return _SEGMENT_PREFIX + hashlib.sha1(os.path.abspath(self.path).encode("utf-8")).hexdigest()[:8] + "_"
+
+    def start_watching(self, interval=REFERENCE_RELOAD_INTERVAL):
+        """Polls the files every `interval` seconds from a daemon thread and hot-swaps changes."""
+        if interval <= 0:
+            return
+        self._watch_interval = interval
+        self._start_watcher()
+
+    def _after_fork(self):
+        # The parent's locks may have been copied while held, and its watcher thread doesn't exist here.
+        self._reload_lock = threading.Lock()
+        self._watcher_lock = threading.Lock()
+
+    def _start_watcher(self):
+        pid = os.getpid()
+        with self._watcher_lock:
+            if self._watcher_pid == pid:
+                return
+            self._watcher_pid = pid
+
+        def watch():
+            while True:
+                time.sleep(self._watch_interval)
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"Error reloading reference material: {e}")
+
+        threading.Thread(target=watch, name="reference-library-watcher", daemon=True).start()
+
+
+# --- Shared memory segments ---
+
+def _open_shared_memory(name, create=False, size=0, untrack=True):
+    from multiprocessing import shared_memory
+    try:
+        # Python 3.13+: opt out of the resource tracker so the segment outlives this worker.
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        segment = shared_memory.SharedMemory(name=name, create=create, size=size)
+        if untrack:
+            # Older Pythons would unlink the segment when *any* attached process exits.
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+def _snapshot_from_segment(segment):
+    deadline = time.monotonic() + _SEGMENT_READY_TIMEOUT
+    header_length = _HEADER_LENGTH.unpack_from(segment.buf, 0)[0]
+    while header_length == 0:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"shared memory segment {segment.name} was never completed")
+        time.sleep(0.01)
+        header_length = _HEADER_LENGTH.unpack_from(segment.buf, 0)[0]
+    header_start = _HEADER_LENGTH.size
+    header = json.loads(bytes(segment.buf[header_start:header_start + header_length]))
+    payload_start = header_start + header_length
+    index = [(name, start + payload_start, end + payload_start) for name, start, end in header["files"]]
+    return ReferenceSnapshot(header["version"], index, segment.buf, segment)
+
+
+def _attach_segment(name):
+    try:
+        segment = _open_shared_memory(name)
+    except FileNotFoundError:
+        return None
+    return _snapshot_from_segment(segment)
+
+
+def _create_segment(name, version, index, payload):
+    header = json.dumps({"version": version, "files": index}).encode("utf-8")
+    size = _HEADER_LENGTH.size + len(header) + len(payload)
+    try:
+        segment = _open_shared_memory(name, create=True, size=max(size, 1))
+    except FileExistsError:
+        # Another worker won the race; use its copy.
+        return _attach_segment(name)
+    start = _HEADER_LENGTH.size
+    segment.buf[start:start + len(header)] = header
+    segment.buf[start + len(header):size] = payload
+    _HEADER_LENGTH.pack_into(segment.buf, 0, len(header)) # Marks the segment as complete.
+    return _snapshot_from_segment(segment)
+
+
+def _unlink_stale_segments(prefix, keep):
+    """
+    Unlinks this path's segments other than `keep`. Segments outlive their workers on purpose
+    (so a restarted worker can attach), which would orphan them once the files change while no
+    worker is running. Workers still mapping one keep their copy; only the name goes away.
+    """
+    try:
+        names = os.listdir(_SHM_DIR)
+    except OSError:
+        return # Not Linux; stale segments can't be enumerated.
+    for name in names:
+        if name.startswith(prefix) and name != keep:
+            _unlink_segment(name)
+
+
+def _unlink_segment(name):
+    try:
+        # Left tracked: on older Pythons unlink() also unregisters it from the resource tracker.
+        segment = _open_shared_memory(name, untrack=False)
+    except FileNotFoundError:
+        return
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+    finally:
+        segment.close()
+
+
+_library = None
+_library_lock = threading.Lock()
+
+def get_reference_library():
+    """Returns the process-wide ReferenceLibrary for REFERENCE_MATERIAL_PATH, watching it for changes."""
+    global _library
+    if _library is None:
+        with _library_lock:
+            if _library is None:
+                library = ReferenceLibrary()
+                library.reload()
+                library.start_watching()
+                _library = library
+    return _library
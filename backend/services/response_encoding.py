@@ -0,0 +1,161 @@
+# backend/services/response_encoding.py
+import os
+import gzip
+
+from flask import Response, current_app
+
+# --- Response Encoding Configuration ---
+# Bodies smaller than this are sent uncompressed; the headers would eat most of the saving.
+COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "3")) # Most of level 6's saving at about a third of the CPU
+BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5")) # 11 is ~10x slower for a few % smaller output
+# ---------------------------------------
+
+# Optional encoders: the formats they provide are simply not offered when the package is missing.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Format name (for ?format=) -> media type (for Accept / Content-Type).
+JSON_MIMETYPE = "application/json"
+COLUMNAR_MIMETYPE = "application/vnd.diagramiq.columnar+json"
+MSGPACK_MIMETYPE = "application/msgpack"
+FORMATS = {"json": JSON_MIMETYPE, "columnar": COLUMNAR_MIMETYPE, "msgpack": MSGPACK_MIMETYPE}
+_MIMETYPE_ALIASES = {"application/x-msgpack": MSGPACK_MIMETYPE}
+
+OCR_WORD_FIELDS = ("text", "left", "top", "width", "height", "conf")
+
+
+class UnsupportedFormat(ValueError):
+    """Raised when ?format= names a format the endpoint (or this server) can't produce."""
+
+
+# --- Columnar OCR encoding ---
+
+def columnar_ocr_blocks(blocks):
+    """
+    Packs extract_text_blocks() output into parallel arrays instead of one dict per word:
+
+        {"format": "ocr-columnar-v1",
+         "blocks": {"block_num": [...], "text": [...], "word_count": [...]},
+         "words":  {"text": [...], "left": [...], "top": [...], "width": [...], "height": [...], "conf": [...]}}
+
+    Words are stored block by block, so block i owns the next word_count[i] words. A "reocr"
+    column (two-pass OCR) is only present when some word carries that flag.
+    """
+    block_columns = {"block_num": [], "text": [], "word_count": []}
+    word_columns = {field: [] for field in OCR_WORD_FIELDS}
+    reocr = []
+    for block in blocks:
+        block_columns["block_num"].append(block["block_num"])
+        block_columns["text"].append(block["text"])
+        block_columns["word_count"].append(len(block["words"]))
+        for word in block["words"]:
+            for field in OCR_WORD_FIELDS:
+                word_columns[field].append(word[field])
+            reocr.append(bool(word.get("reocr")))
+    if any(reocr):
+        word_columns["reocr"] = reocr
+    return {"format": "ocr-columnar-v1", "blocks": block_columns, "words": word_columns}
+
+
+def expand_columnar_ocr_blocks(columnar):
+    """Inverse of columnar_ocr_blocks(): rebuilds the list of block dicts."""
+    words = columnar["words"]
+    blocks, offset = [], 0
+    for block_num, text, count in zip(*(columnar["blocks"][k] for k in ("block_num", "text", "word_count"))):
+        block_words = []
+        for i in range(offset, offset + count):
+            word = {field: words[field][i] for field in OCR_WORD_FIELDS}
+            if words.get("reocr") and words["reocr"][i]:
+                word["reocr"] = True
+            block_words.append(word)
+        blocks.append({"block_num": block_num, "text": text, "words": block_words})
+        offset += count
+    return blocks
+
+
+# --- Negotiation ---
+
+def available_formats(columnar=False):
+    formats = ["json"]
+    if columnar:
+        formats.append("columnar")
+    if msgpack is not None:
+        formats.append("msgpack")
+    return formats
+
+
+def negotiate_format(request, columnar=False):
+    """
+    Picks the response format: an explicit ?format= wins (and must be available), otherwise the
+    best match for the Accept header among the available formats, defaulting to plain JSON.
+    """
+    formats = available_formats(columnar)
+    requested = request.args.get("format")
+    if requested:
+        if requested not in formats:
+            raise UnsupportedFormat(f"Unsupported response format '{requested}'. Available: {formats}")
+        return requested
+
+    by_mimetype = {FORMATS[name]: name for name in formats}
+    by_mimetype.update({alias: by_mimetype[target] for alias, target in _MIMETYPE_ALIASES.items() if target in by_mimetype})
+    # JSON is listed first so "*/*" (and a missing Accept header) keep today's behaviour.
+    best = request.accept_mimetypes.best_match(list(by_mimetype), default=JSON_MIMETYPE)
+    return by_mimetype.get(best, "json")
+
+
+def negotiate_encoding(request):
+    """'br' or 'gzip' from Accept-Encoding (brotli only if the package is installed), else None."""
+    accepted = request.accept_encodings
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    quality = {name: accepted[name] for name in candidates}
+    best = max(candidates, key=lambda name: quality[name]) # max() keeps the first on ties, so br wins
+    return best if quality[best] > 0 else None
+
+
+# --- Serialization ---
+
+def serialize(payload, response_format, columnar=None):
+    """
+    Returns (body bytes, mimetype) for payload in response_format ('json', 'columnar' or 'msgpack').
+    Needs an app context (for the app's JSON provider).
+    """
+    if response_format == "msgpack":
+        return msgpack.packb(payload, use_bin_type=True), MSGPACK_MIMETYPE
+    if response_format == "columnar":
+        payload = columnar(payload)
+    # Same provider and options as jsonify() outside debug mode, so plain JSON stays byte-identical.
+    body = f"{current_app.json.dumps(payload, separators=(',', ':'))}\n".encode("utf-8")
+    return body, FORMATS[response_format]
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def encoded_response(request, payload, response_format, status=200, columnar=None):
+    """
+    Builds the response for an analysis result in `response_format`, honouring Accept-Encoding.
+
+    Routes call negotiate_format() before doing any work (so an unsupported ?format= costs no OCR
+    or LLM call) and pass the result here. `columnar` is the endpoint's columnar encoder (e.g.
+    columnar_ocr_blocks). A client sending neither header gets the same JSON as jsonify().
+    """
+    body, mimetype = serialize(payload, response_format, columnar)
+    response = Response(body, status=status, mimetype=mimetype)
+    encoding = negotiate_encoding(request) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding:
+        response.set_data(compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
@@ -3,7 +3,7 @@ import os
 import datetime
 import uuid
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from google.cloud import storage
 import requests # To fetch image from URL
@@ -12,10 +12,18 @@ import io # To handle image bytes
 import openai # For analyze_diagram_from_url
 import traceback # For detailed error logging
 import json # For potentially parsing LLM response if needed
+import hashlib # For OCR cache keys
 
 # Import your service functions
-from services.ocr_engine import extract_text_blocks
+from services.ocr_engine import extract_text_blocks, extract_text_blocks_two_pass
 from services.edge_detector_fewshot_llm import detect_edges_fewshot # Import the new service
+from services.node_detector_llm import detect_nodes_llm
+from services.document_loader import download_to_tempfile, iter_document_pages, DEFAULT_PDF_DPI
+from services.document_pipeline import ocr_page, page_image_data_url, stream_page_results, DEFAULT_MAX_WORKERS
+from services.analysis_store import get_analysis_store
+from services.reference_library import get_reference_library, extract_port_ids, per_version_cache
+from services.cassette import CASSETTE_MODE, CassetteChat, CassetteMiss, CassetteStorageClient, get_cassette, http_get
+from services.response_encoding import encoded_response, negotiate_format, UnsupportedFormat, columnar_ocr_blocks
 # Note: analyze_diagram_from_url is defined locally in this file now
 # from services.node_detector_yolo import detect_equipment_nodes # No longer using YOLO for this endpoint
 
@@ -48,6 +56,18 @@ if not openai.api_key:
     print("Warning: OPENAI_API_KEY environment variable not set. OpenAI features disabled.")
 # --------------------------
 
+# --- Record/Replay Cassettes (CASSETTE_MODE=record|replay) ---
+# Routes every OpenAI, GCS signed-URL and image-fetch call through on-disk cassettes so the
+# whole app can be benchmarked offline. See services/cassette.py.
+if CASSETTE_MODE != "off":
+    openai.chat = CassetteChat(get_cassette("llm"), openai.chat)
+    if storage_client or CASSETTE_MODE == "replay":
+        storage_client = CassetteStorageClient(get_cassette("storage"), storage_client)
+    if CASSETTE_MODE == "replay" and not openai.api_key:
+        openai.api_key = "cassette-replay" # Routes refuse to run without a key; replay never sends it.
+    print(f"Cassettes enabled in '{CASSETTE_MODE}' mode.")
+# -------------------------------------------------------------
+
 app = Flask(__name__)
 
 # --- Explicit CORS Configuration ---
@@ -59,30 +79,49 @@ cors = CORS(app, resources={
     r"/analyze/ocr": {"origins": "http://localhost:3000"}, # Added OCR route
     r"/analyze/nodes": {"origins": "http://localhost:3000"}, # Add Node Detection route
     r"/analyze/edges": {"origins": "http://localhost:3000"},  # Add Edge Detection route
-    r"/analyze/edges-fewshot": {"origins": "http://localhost:3000"} # Add Few-Shot Edge Detection route
+    r"/analyze/edges-fewshot": {"origins": "http://localhost:3000", "expose_headers": ["X-Reference-Version"]}, # Add Few-Shot Edge Detection route
+    r"/analyze/document": {"origins": "http://localhost:3000"}, # Multi-page document (PDF/TIFF) route
+    r"/store/*": {"origins": "http://localhost:3000"}, # Persistent analysis store routes
+    r"/reference": {"origins": "http://localhost:3000"} # Reference material version
 })
 # Note: For production, you would replace or add your deployed frontend URL.
 # Example: {"origins": ["http://localhost:3000", "https://your-deployed-app.com"]}
 # ---------------------------------
 
-# --- Global variable to hold pre-loaded reference text ---
-REFERENCE_MARKDOWN_CONTENT = None
-REFERENCE_FILE_PATH = os.path.join(os.path.dirname(__file__), 'reference_material', 'site_reference.md') # Updated path
-
-def load_reference_material():
-    """Loads the reference markdown file into the global variable."""
-    global REFERENCE_MARKDOWN_CONTENT
-    try:
-        if os.path.exists(REFERENCE_FILE_PATH):
-            with open(REFERENCE_FILE_PATH, 'r', encoding='utf-8') as f:
-                REFERENCE_MARKDOWN_CONTENT = f.read()
-            print(f"Successfully loaded reference material from: {REFERENCE_FILE_PATH}")
-        else:
-            print(f"Warning: Reference material file not found at {REFERENCE_FILE_PATH}. Few-shot endpoint will lack context.")
-            REFERENCE_MARKDOWN_CONTENT = "" # Set to empty string if not found
-    except Exception as e:
-        print(f"Error loading reference material: {e}")
-        REFERENCE_MARKDOWN_CONTENT = "" # Set to empty string on error
+# --- Reference Material (hot-reloaded, versioned snapshots) ---
+# Every file under reference_material/ (or REFERENCE_MATERIAL_PATH) is loaded once per host into
+# shared memory and re-read automatically when it changes. See services/reference_library.py.
+reference_library = get_reference_library()
+
+# ** TOKEN MANAGEMENT - CRITICAL **
+# Simple Truncation: Limit the reference text length.
+# This is a basic approach; more sophisticated methods (chunking, RAG) are better for large docs.
+# Adjust MAX_REF_LENGTH based on model limits and typical prompt size.
+MAX_REF_LENGTH = 8000 # Example: Limit reference text to ~8k characters
+
+@per_version_cache(maxsize=8)
+def get_truncated_reference(snapshot):
+    """Returns the snapshot's reference material truncated to MAX_REF_LENGTH characters (cached per version)."""
+    content = snapshot.content
+    truncated_reference = (content[:MAX_REF_LENGTH] + '...') if len(content) > MAX_REF_LENGTH else content
+    if not truncated_reference: # Check if truncation resulted in empty content
+        print("Warning: No reference content available for few-shot prompt after potential truncation.")
+    return truncated_reference
+
+@per_version_cache(maxsize=8)
+def get_reference_port_ids(snapshot):
+    """Port ids defined in the snapshot's reference material, used as the two-pass OCR whitelist."""
+    return tuple(extract_port_ids(snapshot.content))
+
+def cassette_miss_response(e):
+    """Response for a request that has no recording while CASSETTE_MODE=replay."""
+    print(f"Cassette miss: {e.args[0]}")
+    return jsonify({"error": f"No recorded response for this request in replay mode ({e.args[0]}). "
+                             "Record it once with CASSETTE_MODE=record."}), 503
+
+def unsupported_format_response(e):
+    """Response for a ?format= the endpoint can't produce; returned before any OCR/LLM work."""
+    return jsonify({"error": str(e)}), 406
 
 # --- Route: Generate GCS Signed URL ---
 @app.route("/generate-upload-url", methods=["POST"])
@@ -121,6 +160,8 @@ def generate_upload_url_route():
 
         return jsonify({"signedUrl": signed_url, "publicUrl": public_url})
 
+    except CassetteMiss as e:
+        return cassette_miss_response(e)
     except Exception as e:
         print(f"Error in /generate-upload-url: {e}")
         traceback.print_exc() # Print full traceback to server logs
@@ -190,6 +231,8 @@ def analyze_diagram_from_url(image_url):
              error_message = f"Could not analyze the image via OpenAI. The model failed to access the image at the provided GCS URL: {image_url}. Ensure the object exists and is publicly readable or the URL is valid."
         # Return 400 for client-side errors (like bad URL)
         return jsonify({"error": error_message}), 400
+    except CassetteMiss as e:
+        return cassette_miss_response(e)
     except Exception as e:
         # Handle other potential exceptions during the API call
         print(f"An unexpected error occurred during OpenAI call: {e}")
@@ -199,6 +242,11 @@ def analyze_diagram_from_url(image_url):
 # --- Route: OCR Analysis ---
 @app.route('/analyze/ocr', methods=['POST'])
 def handle_ocr_analysis():
+
+    try:
+        response_format = negotiate_format(request, columnar=True)
+    except UnsupportedFormat as e:
+        return unsupported_format_response(e)
     data = request.get_json()
     if not data:
         return jsonify({"error": "Missing JSON request body"}), 400
@@ -207,22 +255,37 @@ def handle_ocr_analysis():
     if not image_url:
         return jsonify({"error": "Missing 'image_url' in request body"}), 400
 
+    # "single" (default): one full-page pass. "two-pass": low-confidence words are re-read
+    # with a label whitelist (the reference port ids unless the request supplies its own).
+    mode = data.get('mode', 'single')
+    if mode not in ('single', 'two-pass'):
+        return jsonify({"error": f"Unknown OCR mode '{mode}'. Expected 'single' or 'two-pass'"}), 400
+    whitelist = data.get('whitelist')
+    if whitelist is not None and (not isinstance(whitelist, list) or not all(isinstance(t, str) for t in whitelist)):
+        return jsonify({"error": "'whitelist' must be a list of strings"}), 400
+
     try:
         # 1. Fetch the image from the URL
         print(f"Fetching image for OCR from: {image_url}")
-        response = requests.get(image_url, stream=True, timeout=30) # Timeout for fetching
+        response = http_get(image_url, stream=True, timeout=30) # Timeout for fetching
         response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
 
         # 2. Open the image using Pillow from bytes
         img = Image.open(io.BytesIO(response.content))
+        cache_key = hashlib.sha256(response.content).hexdigest() # OCR cache key; cheaper than hashing decoded pixels
 
         # 3. Perform OCR using the imported service function
-        print("Running OCR...")
-        ocr_results = extract_text_blocks(img) # Call your function from ocr_engine.py
+        print(f"Running OCR ({mode})...")
+        if mode == 'two-pass':
+            if whitelist is None:
+                whitelist = list(get_reference_port_ids(reference_library.snapshot()))
+            ocr_results = extract_text_blocks_two_pass(img, whitelist, cache_key=cache_key)
+        else:
+            ocr_results = extract_text_blocks(img, cache_key=cache_key) # Call your function from ocr_engine.py
         print(f"OCR found {len(ocr_results)} text blocks.")
 
-        # 4. Return the results
-        return jsonify(ocr_results) # Return the list of blocks directly
+        # 4. Return the results (JSON by default; columnar/msgpack and gzip/br on request, see services/response_encoding.py)
+        return encoded_response(request, ocr_results, response_format, columnar=columnar_ocr_blocks)
 
     except requests.exceptions.Timeout:
          print(f"Timeout error fetching image for OCR from URL: {image_url}")
@@ -231,6 +294,8 @@ def handle_ocr_analysis():
         # Handle errors during image fetching (network issues, invalid URL, 404 etc.)
         print(f"Error fetching image for OCR from URL {image_url}: {e}")
         return jsonify({"error": f"Failed to fetch image from URL: {e}"}), 502 # Bad Gateway (or 400 if client URL error)
+    except CassetteMiss as e:
+        return cassette_miss_response(e)
     except Exception as e:
         # Catch potential errors from Pillow or Tesseract/ocr_engine
         print(f"Error during OCR processing: {e}")
@@ -240,6 +305,11 @@ def handle_ocr_analysis():
 # --- Route: Node Detection Analysis (using LLM) ---
 @app.route('/analyze/nodes', methods=['POST'])
 def handle_node_detection_llm(): # Renamed function for clarity
+
+    try:
+        response_format = negotiate_format(request)
+    except UnsupportedFormat as e:
+        return unsupported_format_response(e)
     if not openai.api_key:
          return jsonify({"error": "OpenAI API key not configured on server."}), 500
 
@@ -252,52 +322,16 @@ def handle_node_detection_llm(): # Renamed function for clarity
         return jsonify({"error": "Missing 'image_url' in request body"}), 400
 
     try:
-        # --- Call OpenAI for Node Detection ---
-        print(f"Sending image to LLM for Node Detection: {image_url}")
-
-        system_msg = {
-            "role": "system",
-            "content": (
-                "You are an expert system analyzing engineering diagrams (like P&IDs or flowcharts). "
-                "Your task is to identify distinct equipment nodes or components shown in the diagram. "
-                "List each identified node with a brief label or description. "
-                "Format the output as a JSON list of objects, where each object has a 'id' (sequential number starting from 1) and a 'label' (the identified node description)."
-                "Example Output: [{'id': 1, 'label': 'Pump P-101'}, {'id': 2, 'label': 'Heat Exchanger E-203'}, {'id': 3, 'label': 'Storage Tank T-50'}]"
-            )
-        }
-        user_msg = {
-            "role": "user",
-            "content": [
-                #{"type": "text", "text": "Identify the equipment nodes in the diagram at this URL and provide the output in the specified JSON format:"},
-                {"type": "text", "text": "The diagram is provided via a url. Identify the equipment nodes in the diagram. Provide the output in the specified JSON format:"},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": image_url},
-                },
-            ]
-        }
-
-        resp = openai.chat.completions.create(
-            model="gpt-4o-mini", # Or your preferred model
-            messages=[system_msg, user_msg],
-            response_format={ "type": "json_object" } # Request JSON output
-            # max_tokens=500 # Optional
-        )
-
-        # Attempt to parse the JSON response from the LLM
-        node_results_json_string = resp.choices[0].message.content
-        print(f"LLM Node Detection Raw Response: {node_results_json_string}")
-
-        # Parse the JSON string from the LLM into a Python object
+        # --- Call the dedicated service function ---
         # Add error handling in case the LLM doesn't return valid JSON despite the request
         try:
-            node_results = json.loads(node_results_json_string)
+            node_results = detect_nodes_llm(image_url)
         except json.JSONDecodeError as json_err:
             print(f"Error decoding JSON from LLM response: {json_err}")
-            print(f"LLM Raw Content: {node_results_json_string}")
-            return jsonify({"error": "LLM did not return valid JSON for node detection.", "raw_response": node_results_json_string}), 500
+            print(f"LLM Raw Content: {json_err.doc}")
+            return jsonify({"error": "LLM did not return valid JSON for node detection.", "raw_response": json_err.doc}), 500
 
-        return jsonify(node_results) # Return the parsed Python object (Flask will serialize it)
+        return encoded_response(request, node_results, response_format) # Serialized per the client's Accept / Accept-Encoding
 
     # --- Error Handling (similar to /analyze route) ---
     except requests.exceptions.Timeout:
@@ -312,6 +346,8 @@ def handle_node_detection_llm(): # Renamed function for clarity
         if "Could not retrieve image" in str(e) or "Failed to download image" in str(e):
              error_message = f"Could not perform node detection via OpenAI. The model failed to access the image at the provided GCS URL: {image_url}. Ensure the object exists and is publicly readable or the URL is valid."
         return jsonify({"error": error_message}), 400
+    except CassetteMiss as e:
+        return cassette_miss_response(e)
     except Exception as e:
         print(f"An unexpected error occurred during LLM Node Detection: {e}")
         traceback.print_exc()
@@ -320,6 +356,11 @@ def handle_node_detection_llm(): # Renamed function for clarity
 # --- Route: Edge Detection Analysis (using LLM) ---
 @app.route('/analyze/edges', methods=['POST'])
 def handle_edge_detection_llm():
+
+    try:
+        response_format = negotiate_format(request)
+    except UnsupportedFormat as e:
+        return unsupported_format_response(e)
     if not openai.api_key:
          return jsonify({"error": "OpenAI API key not configured on server."}), 500
 
@@ -373,7 +414,7 @@ def handle_edge_detection_llm():
             print(f"LLM Raw Content: {edge_results_json_string}")
             return jsonify({"error": "LLM did not return valid JSON for edge detection.", "raw_response": edge_results_json_string}), 500
 
-        return jsonify(edge_results)
+        return encoded_response(request, edge_results, response_format)
 
     # --- Error Handling (similar to node detection) ---
     except openai.BadRequestError as e: # Catch OpenAI specific errors first
@@ -382,6 +423,8 @@ def handle_edge_detection_llm():
         if "Could not retrieve image" in str(e) or "Failed to download image" in str(e):
              error_message = f"Could not perform edge detection via OpenAI. The model failed to access the image at the provided GCS URL: {image_url}. Ensure the object exists and is publicly readable or the URL is valid."
         return jsonify({"error": error_message}), 400
+    except CassetteMiss as e:
+        return cassette_miss_response(e)
     except Exception as e: # Catch other general exceptions
         print(f"An unexpected error occurred during LLM Edge Detection: {e}")
         traceback.print_exc()
@@ -390,14 +433,18 @@ def handle_edge_detection_llm():
 # --- Route: Edge Detection Analysis (Few Shot LLM) ---
 @app.route('/analyze/edges-fewshot', methods=['POST'])
 def handle_edge_detection_fewshot_llm():
+
+    try:
+        response_format = negotiate_format(request)
+    except UnsupportedFormat as e:
+        return unsupported_format_response(e)
     # --- Pre-checks (API Key, Reference Content Loading) ---
     if not openai.api_key:
          return jsonify({"error": "OpenAI API key not configured on server."}), 500
-    if REFERENCE_MARKDOWN_CONTENT is None: # Check if loading failed or hasn't happened
-        print("Warning: Reference content not loaded. Attempting to load now.")
-        load_reference_material() # Attempt to load if not already loaded
-        if REFERENCE_MARKDOWN_CONTENT is None: # Check again after attempting load
-             return jsonify({"error": "Failed to load reference material for few-shot analysis."}), 500
+    # Take one snapshot for the whole request so a concurrent reload can't mix versions.
+    reference_snapshot = reference_library.snapshot()
+    if reference_snapshot is None:
+         return jsonify({"error": "Failed to load reference material for few-shot analysis."}), 500
 
 
     data = request.get_json()
@@ -409,14 +456,7 @@ def handle_edge_detection_fewshot_llm():
         return jsonify({"error": "Missing 'image_url' in request body"}), 400
 
     try:
-        # ** TOKEN MANAGEMENT - CRITICAL **
-        # Simple Truncation: Limit the reference text length.
-        # This is a basic approach; more sophisticated methods (chunking, RAG) are better for large docs.
-        # Adjust MAX_REF_LENGTH based on model limits and typical prompt size.
-        MAX_REF_LENGTH = 8000 # Example: Limit reference text to ~8k characters
-        truncated_reference = (REFERENCE_MARKDOWN_CONTENT[:MAX_REF_LENGTH] + '...') if len(REFERENCE_MARKDOWN_CONTENT) > MAX_REF_LENGTH else REFERENCE_MARKDOWN_CONTENT
-        if not truncated_reference and REFERENCE_MARKDOWN_CONTENT is not None: # Check if truncation resulted in empty but original wasn't None
-            print("Warning: No reference content available for few-shot prompt after potential truncation.")
+        truncated_reference = get_truncated_reference(reference_snapshot)
 
         # --- Call the dedicated service function ---
         edge_results = detect_edges_fewshot(image_url, truncated_reference)
@@ -426,7 +466,9 @@ def handle_edge_detection_fewshot_llm():
         # if "error" in edge_results:
         #    return jsonify(edge_results), 500 # Or appropriate status code
 
-        return jsonify(edge_results)
+        response = encoded_response(request, edge_results, response_format)
+        response.headers["X-Reference-Version"] = reference_snapshot.version # Lets clients/caches key on the reference used
+        return response
 
     # --- Error Handling for Exceptions Raised by the Service ---
     except json.JSONDecodeError as json_err:
@@ -444,12 +486,170 @@ def handle_edge_detection_fewshot_llm():
             if "Could not retrieve image" in str(e) or "Failed to download image" in str(e):
                  error_message = f"Could not perform few-shot edge detection. The model failed to access an image URL. Ensure all URLs (diagram and reference images) are valid and accessible."
         return jsonify({"error": error_message}), 400
+    except CassetteMiss as e:
+        return cassette_miss_response(e)
     except Exception as e:
         # Catch errors raised by the service function or other unexpected issues
         print(f"An unexpected error occurred during LLM Few-Shot Edge Detection: {e}")
         traceback.print_exc()
         return jsonify({"error": "An unexpected error occurred during Few-Shot Edge Detection analysis."}), 500
 
+# --- Route: Multi-page Document Analysis (PDF / large TIFF, streamed per page) ---
+DOCUMENT_TOOLS = ("ocr", "edges-fewshot")
+
+@app.route('/analyze/document', methods=['POST'])
+def handle_document_analysis():
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Missing JSON request body"}), 400
+
+    document_url = data.get('document_url') or data.get('image_url')
+    if not document_url:
+        return jsonify({"error": "Missing 'document_url' in request body"}), 400
+
+    tool_ids = data.get('tools', ["ocr"])
+    unknown_tools = [t for t in tool_ids if t not in DOCUMENT_TOOLS]
+    if unknown_tools:
+        return jsonify({"error": f"Unsupported tools for document analysis: {unknown_tools}. Supported: {list(DOCUMENT_TOOLS)}"}), 400
+    if "edges-fewshot" in tool_ids:
+        if not openai.api_key:
+            return jsonify({"error": "OpenAI API key not configured on server."}), 500
+
+    try:
+        dpi = int(data.get('dpi', DEFAULT_PDF_DPI))
+        max_workers = max(1, min(int(data.get('max_workers', DEFAULT_MAX_WORKERS)), 8))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'dpi' and 'max_workers' must be integers"}), 400
+
+    tools = {}
+    if "ocr" in tool_ids:
+        tools["ocr"] = ocr_page
+    if "edges-fewshot" in tool_ids:
+        reference = get_truncated_reference(reference_library.snapshot())
+        tools["edges-fewshot"] = lambda page: detect_edges_fewshot(page_image_data_url(page), reference)
+
+    try:
+        # Download to disk (not memory) so pages can be rasterized/read band by band lazily.
+        print(f"Fetching document for analysis from: {document_url}")
+        document_path = download_to_tempfile(document_url)
+    except CassetteMiss as e:
+        return cassette_miss_response(e)
+    except requests.exceptions.Timeout:
+        print(f"Timeout error fetching document from URL: {document_url}")
+        return jsonify({"error": f"Timeout fetching document from URL: {document_url}"}), 504
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching document from URL {document_url}: {e}")
+        return jsonify({"error": f"Failed to fetch document from URL: {e}"}), 502
+
+    def generate():
+        # One JSON object per line (NDJSON), emitted as each page completes.
+        try:
+            pages = iter_document_pages(document_path, dpi=dpi)
+            for page_result in stream_page_results(pages, tools, max_workers=max_workers):
+                yield json.dumps(page_result) + "\n"
+            yield json.dumps({"done": True}) + "\n"
+        except Exception as e:
+            print(f"Error during document analysis: {e}")
+            traceback.print_exc()
+            yield json.dumps({"error": f"An error occurred during document analysis: {str(e)}"}) + "\n"
+        finally:
+            os.remove(document_path)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# --- Route: Reference Material Version ---
+@app.route('/reference', methods=['GET'])
+def handle_reference_info():
+    """Reports the reference snapshot currently in use, so clients can key caches on its version."""
+    return jsonify(reference_library.snapshot().describe())
+
+# --- Routes: Persistent Analysis Store ---
+@app.route('/store/diagrams', methods=['POST'])
+def handle_store_save():
+    """
+    Saves a DiagramIQ document (the frontend's consolidated JSON) as a new revision.
+    The diagram is keyed by 'diagram_key' if given, otherwise by its GCS image URL.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Missing JSON request body"}), 400
+
+    metadata = data.get("diagramIQ_metadata") or {}
+    image_url = data.get("image_url") or metadata.get("gcsImageUrl")
+    diagram_key = data.get("diagram_key") or image_url
+    if not diagram_key:
+        return jsonify({"error": "Missing 'diagram_key' (or diagramIQ_metadata.gcsImageUrl) in request body"}), 400
+
+    try:
+        saved = get_analysis_store().save_revision(
+            diagram_key, data, site=data.get("site"), image_url=image_url, metadata=metadata
+        )
+        return jsonify(saved), 201
+    except Exception as e:
+        print(f"Error saving analysis results: {e}")
+        traceback.print_exc()
+        return jsonify({"error": f"Failed to save analysis results: {str(e)}"}), 500
+
+@app.route('/store/diagrams', methods=['GET'])
+def handle_store_list():
+    try:
+        return jsonify(get_analysis_store().list_diagrams(
+            site=request.args.get("site"),
+            page=request.args.get("page", 1, type=int),
+            page_size=request.args.get("page_size", type=int),
+        ))
+    except Exception as e:
+        print(f"Error listing stored diagrams: {e}")
+        traceback.print_exc()
+        return jsonify({"error": f"Failed to list stored diagrams: {str(e)}"}), 500
+
+@app.route('/store/diagrams/<path:diagram_key>', methods=['GET'])
+def handle_store_get(diagram_key):
+
+    try:
+        response_format = negotiate_format(request)
+    except UnsupportedFormat as e:
+        return unsupported_format_response(e)
+    stored = get_analysis_store().get_revision(diagram_key, revision=request.args.get("revision", type=int))
+    if stored is None:
+        return jsonify({"error": f"No stored results for diagram '{diagram_key}'"}), 404
+    return encoded_response(request, stored, response_format)
+
+@app.route('/store/search/text', methods=['GET'])
+def handle_store_text_search():
+    query = request.args.get("q")
+    if not query:
+        return jsonify({"error": "Missing 'q' query parameter"}), 400
+    try:
+        return jsonify(get_analysis_store().search_text(
+            query,
+            page=request.args.get("page", 1, type=int),
+            page_size=request.args.get("page_size", type=int),
+            latest_only=request.args.get("all_revisions") is None,
+        ))
+    except Exception as e:
+        # Most likely an FTS5 syntax error in the user's query.
+        print(f"Error during OCR text search: {e}")
+        return jsonify({"error": f"Invalid search query: {str(e)}"}), 400
+
+@app.route('/store/search/connections', methods=['GET'])
+def handle_store_connection_search():
+    """e.g. /store/search/connections?equipment=BB6648&port=RI-A&peer_type=radio"""
+    filters = {k: request.args.get(k) for k in ("equipment", "port", "peer_equipment", "peer_type", "site")}
+    if not any(filters.values()):
+        return jsonify({"error": "Provide at least one of: equipment, port, peer_equipment, peer_type, site"}), 400
+    try:
+        return jsonify(get_analysis_store().find_connections(
+            **filters,
+            page=request.args.get("page", 1, type=int),
+            page_size=request.args.get("page_size", type=int),
+            latest_only=request.args.get("all_revisions") is None,
+        ))
+    except Exception as e:
+        print(f"Error during connection search: {e}")
+        traceback.print_exc()
+        return jsonify({"error": f"Failed to search connections: {str(e)}"}), 500
+
 
 if __name__ == "__main__":
     # Perform checks for essential environment variables on startup
@@ -469,8 +669,8 @@ if __name__ == "__main__":
     else:
         print("All required environment variables seem to be set.")
 
-    # Load reference material on startup
-    load_reference_material()
+    # Reference material is loaded (and watched for changes) at import time
+    print(f"Reference material version: {reference_library.version}")
 
     print("Starting Flask server...")
     print("Available routes:")
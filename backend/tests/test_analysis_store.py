@@ -0,0 +1,34 @@
+# backend/tests/test_analysis_store.py
+import pytest
+
+from services.analysis_store import AnalysisStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AnalysisStore(str(tmp_path / "store.sqlite3"))
+    store.save_revision("site-1-diagram", {"edges_fewshot": {"edges": [
+        {"source": "Baseband 6648 RI-A", "target": "Radio 4480 DATA 1"},
+        {"source": "Router 6671 port 10", "target": "Baseband 6630 TN-A"},
+    ]}}, site="S1")
+    return store
+
+
+def test_site_filter_returns_each_edge_once(store):
+    assert len(store.find_connections(site="S1")["items"]) == 2
+
+
+@pytest.mark.parametrize("equipment", ["BB6648", "Baseband 6648", "bb 6648"])
+def test_equipment_filter_is_canonicalized(store, equipment):
+    assert len(store.find_connections(equipment=equipment, port="ri-a")["items"]) == 1
+
+
+@pytest.mark.parametrize("peer_type", ["radio", "RU", "rru", "AIR"])
+def test_peer_type_filter_is_canonicalized(store, peer_type):
+    items = store.find_connections(equipment="BB6648", peer_type=peer_type)["items"]
+    assert [item["peer_equipment"] for item in items] == ["RU4480"]
+
+
+def test_prefix_search_on_port_labels(store):
+    store.save_revision("ocr-diagram", {"ocr": [{"block_num": 1, "text": "RI-A RI-B", "words": []}]}, site="S1")
+    assert len(store.search_text("RI-A*")["items"]) == 1
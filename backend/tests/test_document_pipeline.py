@@ -0,0 +1,62 @@
+# backend/tests/test_document_pipeline.py
+import pytest
+
+from services import document_pipeline
+
+
+class FakeBand:
+    def __init__(self, top, height):
+        self.top = top
+        self.height = height
+
+    def close(self):
+        pass
+
+
+class FakePage:
+    """A page whose bands 'contain' the given word tops; mirrors RasterPage.iter_bands geometry."""
+
+    def __init__(self, height, word_tops, word_height=20):
+        self.height = height
+        self.word_tops = word_tops
+        self.word_height = word_height
+
+    def iter_bands(self, band_height, overlap):
+        for top in range(0, self.height, band_height):
+            band_top = max(0, top - overlap)
+            yield top, FakeBand(band_top, min(top + band_height + overlap, self.height) - band_top)
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    def install(page):
+        def extract_text_blocks(band, cache=True):
+            words = [
+                {"text": f"w{y}", "left": 0, "top": y - band.top, "width": 10, "height": page.word_height, "conf": 90}
+                for y in page.word_tops
+                if band.top <= y and y + page.word_height <= band.top + band.height
+            ]
+            return [{"block_num": 1, "text": "", "words": words}]
+        monkeypatch.setattr(document_pipeline, "extract_text_blocks", extract_text_blocks)
+    return install
+
+
+def _reported_tops(page, band_height, overlap):
+    result = document_pipeline.ocr_page(page, band_height=band_height, overlap=overlap)
+    return sorted(w["top"] for block in result for w in block["words"])
+
+
+@pytest.mark.parametrize("height", [2100, 2048 + 64, 4096, 5000, 10000])
+def test_words_near_band_boundaries_reported_once(fake_ocr, height):
+    word_tops = list(range(0, height - 20, 37)) + [2030, 2040, 2048, 2060]
+    word_tops = sorted(set(y for y in word_tops if y + 20 <= height))
+    page = FakePage(height, word_tops)
+    fake_ocr(page)
+    assert _reported_tops(page, band_height=2048, overlap=128) == word_tops
+
+
+def test_short_last_band_does_not_duplicate(fake_ocr):
+    # Band 0's overlap reaches the page end (2100), but band 1 still owns rows >= 2048.
+    page = FakePage(2100, [2060])
+    fake_ocr(page)
+    assert _reported_tops(page, band_height=2048, overlap=128) == [2060]
@@ -0,0 +1,25 @@
+# backend/tests/test_metrics.py
+from evaluation.metrics import edge_metrics, ocr_label_metrics
+from services.analysis_store import parse_endpoint
+
+
+def test_parse_endpoint_numbered_router_ports():
+    assert parse_endpoint("Router 6671 port 10") == ("R6671", "router", "10")
+    assert parse_endpoint("R6671 Port: 11") == ("R6671", "router", "11")
+    assert parse_endpoint("Router 6671 10") == ("R6671", "router", "10")
+    # The model number itself is never mistaken for a port.
+    assert parse_endpoint("Router 6671") == ("R6671", "router", None)
+    assert parse_endpoint("Baseband 6630 TN-A") == ("BB6630", "baseband", "TN-A")
+
+
+def test_free_text_router_edge_matches_annotated_ports():
+    predicted = [{"source": "Router 6671 port 10", "target": "Baseband 6630 TN-A"}]
+    expected = [{"source": "Router 6671", "source_port": "10", "target": "Baseband 6630", "target_port": "TN-A"}]
+    ports = edge_metrics(predicted, expected)["ports"]
+    assert (ports["tp"], ports["fp"], ports["fn"]) == (1, 0, 0)
+
+
+def test_label_metrics_ignore_non_label_words():
+    blocks = [{"words": [{"text": "Baseband"}, {"text": "ri-a"}, {"text": "RI-8"}, {"text": "TN-A"}]}]
+    scores = ocr_label_metrics(blocks, ["Baseband", "6648", "RI-A", "RI-B", "TN-A"], ["RI-A", "RI-B", "TN-A"])
+    assert (scores["tp"], scores["fp"], scores["fn"]) == (2, 0, 1)